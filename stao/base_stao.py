@@ -15,12 +15,26 @@
 # ===============================================================================
 import datetime
 import json
-from itertools import groupby
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+
+import pandas as pd
 import pytz
 
 from google.cloud import bigquery, storage
 
-from stao.util import make_statime, asiotid, make_sta_client, make_geometry_point_from_latlon
+from stao.cache import CachingClient
+from stao.cursor import cursor_factory, CompositeCursor
+from stao.dedup import ObservationIndex, epoch_key
+from stao.query import BQQuery
+from stao.resolver import EntityResolver
+from stao.store import WatermarkStore, BlobManifest, make_digest, store_factory, flush_stores
+from stao.timestamps import parse_timestamps, format_timestamps, to_datetimes, ST_FORMAT
+from stao.util import make_statime, asiotid, make_sta_client, make_geometry_point_from_latlon, get_bq_client, \
+    record_bq_query, BQ_STATS, is_data_array, chunk_rows, iter_batches, frame_to_records, is_failed_load
 from stao.vocab import vocab_factory
 
 
@@ -33,6 +47,12 @@ from stao.vocab import vocab_factory
 #     from stao.vocab import vocab_factory
 
 
+class LoadError(Exception):
+    """
+    raised by BaseSTAO._load_one when a payload of the record was not loaded
+    """
+
+
 class ObservationMixin:
     """
     Observation mixin class.
@@ -51,31 +71,84 @@ class ObservationMixin:
     _value_field = None
     _cursor_id = None
 
-    _location = None
-    _thing = None
-    _datastream = None
+    # the Location, Thing and Datastream of the record being transformed. these are kept per thread so that
+    # records can be loaded concurrently. see BaseSTAO._concurrency
+    @property
+    def _location(self):
+        return getattr(self._get_local(), 'location', None)
+
+    @_location.setter
+    def _location(self, v):
+        self._get_local().location = v
+
+    @property
+    def _thing(self):
+        return getattr(self._get_local(), 'thing', None)
+
+    @_thing.setter
+    def _thing(self, v):
+        self._get_local().thing = v
+
+    @property
+    def _datastream(self):
+        return getattr(self._get_local(), 'datastream', None)
+
+    @_datastream.setter
+    def _datastream(self, v):
+        self._get_local().datastream = v
+
+    def _get_local(self):
+        return self.__dict__.setdefault('_thread_local', threading.local())
+
+    # only fetch the existing observations that fall within the time window of the incoming batch.
+    # the window is padded by _dedup_window_slack seconds on either side
+    _dedup_window = True
+    _dedup_window_slack = 60
+
+    # consult the persistent per-datastream high-water mark before fetching the existing observations
+    _use_watermarks = True
+    _watermarks = None
+    _pending_watermarks = None
+    _watermarks_lock = threading.Lock()
+
+    # the Location property matched by _get_location. used to resolve all the Locations of a batch up front.
+    # set to None to look up each Location individually with _get_location
+    _location_key_property = 'properties/source_id'
+
+    # strptime formats of the timestamp field. when defined the timestamps of a record are parsed in one vectorized
+    # pass instead of calling _extract_timestamp/_transform_timestamp on each observation
+    _timestamp_formats = None
 
     def _get_load_function_name(self):
         return 'add_observations'
 
+    def _preload(self, records):
+        if self._location_key_property:
+            keys = [self._get_location_key(r) for r in records]
+            self._get_resolver().prefetch(keys, self._location_key_property, self._agency)
+
+    def _get_location_key(self, record):
+        location_id = record['locationId']
+        try:
+            location_id = int(location_id)
+        except ValueError:
+            pass
+        return location_id
+
     def _get_location(self, record, location_id=None):
         if location_id is None:
-            location_id = record['locationId']
-            try:
-                location_id = int(location_id)
-            except ValueError:
-                pass
+            location_id = self._get_location_key(record)
 
         q = f"properties/source_id eq '{location_id}' and properties/agency eq '{self._agency}'"
         return self._client.get_location(query=q), location_id
 
     def _location_grouper(self, records):
         def key(r):
-            v = r[self._location_field]
-            try:
-                return int(v)
-            except ValueError:
-                return v
+            return self._get_group_key(r[self._location_field])
+
+        if self._stream:
+            # the records are already ordered by location. see BQSTAO._get_bq_items
+            return groupby(records, key=key)
 
         return groupby(sorted(records, key=key), key=key)
 
@@ -91,25 +164,91 @@ class ObservationMixin:
         :return:
         """
 
+        if isinstance(records, pd.DataFrame):
+            yield from self._handle_extract_frame(records)
+            return
+
         maxo = None
-        records = [r for r in records if r[self._value_field] is not None]
+        records = (r for r in records if r[self._value_field] is not None)
         for g, obs in self._location_grouper(records):
             obs = list(obs)
             t = self._get_max_cursor(obs)
-            if maxo:
+            if maxo and t:
                 maxo = max(maxo, t)
-            else:
+            elif not maxo:
                 maxo = t
 
             yield {'locationId': g, 'observations': obs,
                    self._cursor_id: maxo}
 
+    def _handle_extract_frame(self, df):
+        """
+        columnar version of _handle_extract. see BQSTAO._columnar
+
+        the null filtering, grouping and cursor computation are done on whole columns
+        """
+        if df.empty:
+            return
+
+        df = df[df[self._value_field].notna()]
+        if df.empty:
+            return
+
+        keys = df[self._location_field]
+        nkeys = pd.to_numeric(keys, errors='coerce')
+        if nkeys.notna().all() and (nkeys % 1 == 0).all():
+            keys = nkeys.astype('int64')
+        else:
+            keys = keys.map(self._get_group_key)
+
+        groups = df.groupby(keys.to_numpy(), sort=not self._stream)
+        codec = getattr(self, '_cursor_codec', None)
+        if isinstance(codec, CompositeCursor):
+            # tuples of columns are compared row by row
+            gmax = [(k, max(zip(*(g[n].tolist() for n in codec.names)))) for k, g in groups]
+            cursors = pd.Series([m for _, m in gmax], index=[k for k, _ in gmax], dtype=object).cummax()
+        else:
+            cid = self._cursor_id.split('.')[-1]
+            # running max of the cursor in group order, the same as the row by row path
+            cursors = groups[cid].max().cummax()
+
+        rows = frame_to_records(df)
+        indices = groups.indices
+        for g, maxo in cursors.items():
+            if isinstance(maxo, pd.Timestamp):
+                maxo = maxo.to_pydatetime()
+            obs = [rows[i] for i in indices[g]]
+            yield {'locationId': g, 'observations': obs,
+                   self._cursor_id: maxo}
+
+    def _get_group_key(self, v):
+        try:
+            return int(v)
+        except ValueError:
+            return v
+
     def _get_max_cursor(self, obs):
+        return max((c for c in self._get_row_cursors(obs) if c is not None), default=None)
+
+    def _get_row_cursors(self, obs):
+        codec = getattr(self, '_cursor_codec', None)
+        if isinstance(codec, CompositeCursor):
+            return [codec.get_row_cursor(o) for o in obs]
+
         cid = self._cursor_id
+        if cid is None:
+            return []
+
         if '.' in cid:
             cid = cid.split('.')[-1]
 
-        return max((o[cid] for o in obs))
+        return [o.get(cid) for o in obs]
+
+    def _get_record_cursors(self, record):
+        """
+        the cursors of the individual rows grouped into record. used by BQSTAO to page past failed rows
+        """
+        return self._get_row_cursors(record['observations'])
 
     def _transform_value(self, v, record):
         return v
@@ -125,13 +264,17 @@ class ObservationMixin:
     def _get_thing_name(self, record):
         return self._thing_name
 
-    def _get_thing(self,record, loc):
+    def _get_thing(self, record, loc):
         name = self._get_thing_name(record)
-        return self._client.get_thing(name=name, location=loc['@iot.id'])
+        return self._get_resolver().thing(loc, name)
 
     def _get_datastream(self, request, record):
         print(record)
-        loc, locationId = self._get_location(record)
+        if self._location_key_property:
+            locationId = self._get_location_key(record)
+            loc = self._get_resolver().location(locationId, self._location_key_property, self._agency)
+        else:
+            loc, locationId = self._get_location(record)
         if not loc:
             print(f'******* no location {locationId}')
         else:
@@ -147,102 +290,180 @@ class ObservationMixin:
                 print(f'********* no thing for location {locationId}, thing={self._thing_name}, location={loc}')
 
             else:
-                try:
-                    return self._client.get_datastream(name=self._datastream_name, thing=thing['@iot.id'])
-                except StopIteration:
+                ds = self._get_resolver().datastream(thing, self._datastream_name)
+                if not ds:
                     print(f'********* no datastream for location {locationId}, datastream={self._datastream_name}, '
                           f'thing={thing}')
-                    return
+                return ds
 
     def _get_timestamp(self, obs):
         return obs[self._timestamp_field]
 
+    def _parse_observations(self, record):
+        """
+        parse the observations of a grouped record
+
+        :param record: dict. a record yielded by _handle_extract
+        :return: list of (datetime, ST formatted time, value) tuples
+        """
+        observations = record['observations']
+        if self._timestamp_formats:
+            timestamps = self._parse_timestamps(observations)
+        else:
+            timestamps = (self._parse_timestamp(obs) for obs in observations)
+
+        parsed = []
+        for obs, (dt, t) in zip(observations, timestamps):
+            if not dt:
+                print(f'skipping invalid datetime. {self._get_timestamp(obs)}')
+                continue
+
+            v = obs[self._value_field]
+            try:
+                v = float(v)
+                v = self._transform_value(v, obs)
+            except (TypeError, ValueError) as e:
+                print(f'skipping. error={e}. v={v}')
+
+            parsed.append((dt, t, v))
+        return parsed
+
+    def _parse_timestamp(self, obs):
+        """
+        :return: (datetime, ST formatted time) or (None, None)
+        """
+        dt = self._get_timestamp(obs)
+        dt = self._extract_timestamp(dt)
+        if dt:
+            dt = self._transform_timestamp(dt)
+            if dt:
+                return dt, dt.strftime(ST_FORMAT)
+        return None, None
+
+    def _parse_timestamps(self, observations):
+        """
+        vectorized _parse_timestamp using _timestamp_formats
+        """
+        timestamps = parse_timestamps((self._get_timestamp(obs) for obs in observations), self._timestamp_formats,
+                                      key=(self.__class__.__name__, self._timestamp_field))
+        return zip(to_datetimes(timestamps), format_timestamps(timestamps))
+
+    def _get_existing_observations(self, ds, parsed):
+        """
+        get the observations already stored in the datastream.
+
+        if _dedup_window is enabled only the observations within the time window of the parsed batch are retrieved
+
+        :param ds: dict. datastream
+        :param parsed: list of (datetime, ST formatted time, value) tuples
+        :return: list of ST observation dicts
+        """
+        if not parsed:
+            return []
+
+        if self._dedup_window:
+            slack = datetime.timedelta(seconds=self._dedup_window_slack)
+            dts = [p[0] for p in parsed]
+            start = (min(dts) - slack).strftime(ST_FORMAT)
+            end = (max(dts) + slack).strftime(ST_FORMAT)
+            q = f'phenomenonTime ge {start} and phenomenonTime le {end}'
+            print(f'getting existing obs between {start} and {end}')
+
+            # pysta.Client.get_observations does not accept a query, so query the Observations of the
+            # datastream directly
+            eobs = self._client.get_datastreams(q, entity=f"Datastreams({ds['@iot.id']})/Observations",
+                                                orderby='phenomenonTime desc')
+        else:
+            eobs = self._client.get_observations(ds,
+                                                 verbose=False,
+                                                 orderby='phenomenonTime desc')
+        return list(eobs)
+
+    def _get_watermarks(self):
+        if self._watermarks is None:
+            self._watermarks = WatermarkStore(namespace=self._client.base_url)
+        return self._watermarks
+
+    def _stage_watermark(self, ds, parsed, digest):
+        """
+        hold the new high-water mark until the payload has been loaded
+        """
+        dt, t, _ = max(parsed, key=lambda p: epoch_key(p[0]))
+        with self._watermarks_lock:
+            if self._pending_watermarks is None:
+                self._pending_watermarks = {}
+            self._pending_watermarks[ds['@iot.id']] = (t, epoch_key(dt), digest)
+
+    def _post_load_record(self, payload, dry, obj):
+        """
+        move the staged high-water mark of the payload's datastream into the store if the payload was loaded
+
+        :param obj: the result of _load_record. None, or a list containing None, if a POST failed
+        """
+        if dry or not self._pending_watermarks:
+            return
+
+        iotid = payload['Datastream']['@iot.id']
+        with self._watermarks_lock:
+            wm = self._pending_watermarks.pop(iotid, None)
+
+        if is_failed_load(obj):
+            print(f'failed loading datastream={iotid}. not updating the high-water mark')
+            return
+
+        if wm:
+            self._get_watermarks().update(iotid, *wm)
+
     def _transform(self, request, record):
         ds = self._get_datastream(request, record)
         print('asdfasdfasdfasfas', ds)
         if ds:
             self._datastream = ds
-            eobs = self._client.get_observations(ds,
-                                                 # limit=2000,
-                                                 # pages=1,
-                                                 verbose=False,
-                                                 orderby='phenomenonTime desc')
-            eobs = list(eobs)
+            parsed = self._parse_observations(record)
+            if not parsed:
+                return
 
-            print(f'existing obs={len(eobs)} datastream={ds} ')
+            digest = make_digest((t, v) for _, t, v in parsed)
+            wm = None
+            if self._use_watermarks:
+                wm = self._get_watermarks().get(ds['@iot.id'])
 
-            def func(e):
-                tt = make_statime(e['phenomenonTime'])
-                # tt.replace(tzinfo=pytz.UTC)
-                return tt, e['result']
+            if wm and digest in wm['digests']:
+                print(f'batch already loaded. digest={digest} datastream={ds}')
+                return
 
-            eeobs = [func(e) for e in eobs]
+            if wm and min(epoch_key(p[0]) for p in parsed) > wm['epoch']:
+                print(f'batch is newer than high-water mark {wm["phenomenonTime"]}. skipping existing obs')
+                eobs = []
+            else:
+                eobs = self._get_existing_observations(ds, parsed)
+
+            print(f'existing obs={len(eobs)} datastream={ds} ')
+
+            eeobs = ObservationIndex.from_observations(eobs)
 
             vs = []
             duplicates = []
             components = ['phenomenonTime', 'resultTime', 'result']
 
-            for obs in record['observations']:
-                # print(obs)
-
-                dt = self._get_timestamp(obs)
-                dt = self._extract_timestamp(dt)
-                if not dt:
-                    print(f'skipping invalid datetime. {dt}')
-                    continue
-                dt = self._transform_timestamp(dt)
-
-                if not dt:
-                    print(f'skipping invalid datetime. {dt}')
-                    continue
-
-                # if not last_obs or (last_obs and dt > last_obs):
-                t = dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-                v = obs[self._value_field]
-                try:
-                    v = float(v)
-                    v = self._transform_value(v, obs)
-                except (TypeError, ValueError) as e:
-                    print(f'skipping. error={e}. v={v}')
-
-                # if self._client.get_observation(t, v):
-                #     print(f'skipping already exists {t}, {v}')
-                #     continue
-                # if observation_exists(eobs, dt, v):
-                ee = any(e[0] == dt and e[1] == v for e in eeobs)
-                if ee:
+            for dt, t, v in parsed:
+                if (dt, v) in eeobs:
                     duplicates.append((t, v))
-                    continue
                 else:
                     vs.append((t, t, v))
-                # print('checking existing obs', len(ee), dt)
-                # for (dti, vi) in ee:
-                #     # print(vi, v)
-                #     # if v == vi:
-                #     #     if abs(dt-dti) < datetime.timedelta(days=1):
-                #     #         print(dti, dt, dti-dt)
-                #
-                #     if dti == dt and v == vi:
-                #         duplicates.append((t, v))
-                #         # print(f'assuming already exists {t}, {v}')
-                #         break
-                # else:
-                #     vs.append((t, t, v))
-
-                # if (dt, v) in eeobs:
-                #     duplicates.append((t, v))
-                #     # print(f'assuming already exists {t}, {v}')
-                #     continue
 
             if duplicates:
                 print(f'found {len(duplicates)} duplicates')
                 print(duplicates)
 
             if vs:
+                if self._use_watermarks:
+                    self._stage_watermark(ds, parsed, digest)
+
                 payload = {'Datastream': asiotid(ds),
                            'observations': vs,
                            'components': components}
-                if len(vs)< 100:
+                if len(vs) < 100:
                     print('------------- payload', payload)
                 return payload
 
@@ -284,7 +505,7 @@ class SimpleSTAO(STAO):
         :param payload: dict.  JSON-style payload for the entity
         :return: None
         """
-        client = make_sta_client()
+        client = CachingClient(make_sta_client())
 
         func = getattr(client, f'put_{tag}')
         func(payload)
@@ -304,17 +525,58 @@ class BaseSTAO(STAO):
     _entity_tag = None
     _cursor_id = 'OBJECTID'
     _vocab_tag = None
+    _resolver = None
+
+    # number of records transformed and loaded concurrently. None or 1 loads the records one after another.
+    # the "concurrency" key of the request state overrides _concurrency but is capped at _max_concurrency
+    _concurrency = None
+    _max_concurrency = 8
+
+    # dataArray observation payloads are split into chunks of at most _observation_chunk_rows rows and
+    # _observation_chunk_bytes bytes. _observation_chunk_workers chunks are POSTed at a time. 1 POSTs the chunks in
+    # order. each concurrent record load (see _concurrency) gets its own chunk workers, so up to
+    # _max_concurrency * _observation_chunk_workers POSTs can be in flight at once
+    _observation_chunk_rows = 100
+    _observation_chunk_bytes = 256 * 1024
+    _observation_chunk_workers = 1
+
+    # consume the extracted records lazily, _stream_batch records at a time, instead of loading them all into memory.
+    # observation STAOs then expect the records to be ordered by location
+    _stream = False
+    _stream_batch = 100
+
+    # drain mode. keep extracting and loading pages (cursor > last cursor) until a page does not advance the cursor or
+    # _drain_budget seconds have passed. keep the budget safely below the function timeout. the state is checkpointed
+    # to the store after each page. the "drain_budget" key of the request state overrides _drain_budget
+    _drain_budget = None
+
+    # number of records that failed to load in the last call to _load
+    _failed_count = 0
 
     def __init__(self, secret_id=None, project_id=None):
         """
         """
-        self._client = make_sta_client(project_id=project_id, secret_id=secret_id)
+        self._client = CachingClient(make_sta_client(project_id=project_id, secret_id=secret_id))
         self.state = {}
         self._vocab_mapper = vocab_factory(self._vocab_tag)
 
+    def _get_resolver(self):
+        """
+        EntityResolver used to look up Location -> Thing -> Datastream chains.
+
+        implement a _preload(self, records) method to prefetch all the Locations of a batch
+        :return: EntityResolver
+        """
+        if self._resolver is None:
+            self._resolver = EntityResolver(self._client)
+        return self._resolver
+
     def toST(self, *args, **kw):
         return self._vocab_mapper.toST(*args, **kw)
 
+    def toST_many(self, *args, **kw):
+        return self._vocab_mapper.toST_many(*args, **kw)
+
     def render(self, request, dry=False):
         """
 
@@ -330,6 +592,10 @@ class BaseSTAO(STAO):
             elif request.json:
                 self.state = request.json
 
+        budget = self._get_drain_budget()
+        if budget:
+            return self._drain(request, dry, budget)
+
         data = self._extract(request)
         if data:
             resp = self._load(request, data, dry)
@@ -338,6 +604,68 @@ class BaseSTAO(STAO):
 
         return resp
 
+    def _get_drain_budget(self):
+        b = self._drain_budget
+        try:
+            b = float(self.state['drain_budget'])
+        except (KeyError, ValueError, TypeError):
+            pass
+        return b
+
+    def _encode_checkpoint(self, obj):
+        if isinstance(obj, (datetime.datetime, datetime.date)):
+            return obj.isoformat()
+        return str(obj)
+
+    def _drain(self, request, dry, budget):
+        """
+        extract and load pages until the cursor stops advancing or the budget is spent
+
+        :param budget: float. wall clock budget in seconds
+        :return: dict. the state after the last page
+        """
+        key = f'state:{self.__class__.__name__}'
+        store = store_factory()
+        if self._cursor_id not in self.state:
+            checkpoint = store.get(key)
+            if checkpoint:
+                print(f'resuming from checkpoint {checkpoint}')
+                self.state = dict(checkpoint, **self.state)
+                request = dict(self.state)
+
+        st = time.time()
+        page = 0
+        slowest = 0
+        while 1:
+            pst = time.time()
+            previous = self.state.get(self._cursor_id)
+
+            # the first page uses the request. later pages are keyed off the cursor of the previous page
+            data = self._extract(request if page == 0 else dict(self.state))
+            if data:
+                self._load(request, data, dry)
+            page += 1
+
+            cursor = self.state.get(self._cursor_id)
+            if not dry:
+                store.set(key, json.loads(json.dumps(self.state, default=self._encode_checkpoint)))
+                store.flush()
+
+            et = time.time() - pst
+            slowest = max(slowest, et)
+            elapsed = time.time() - st
+            print(f'drained page {page} cursor={cursor} {et:0.2f}s elapsed={elapsed:0.2f}s budget={budget}s')
+
+            if cursor is None or cursor == previous:
+                print('cursor did not advance. drained')
+                break
+
+            if elapsed + slowest > budget:
+                print('drain budget spent')
+                break
+
+        return self.state
+
     def _extract(self, request):
         raise NotImplementedError
 
@@ -368,51 +696,164 @@ class BaseSTAO(STAO):
         Load a list of records to an ST instance
 
         :param request: Request object passed in by the CloudFunction trigger
-        :param records: list of records
+        :param records: list of records. any iterable if _stream is enabled
         :param dry: flag for testing. if true goes through the motions but does not send POSTs to the
         ST server
         :return:
         """
-        cnt = 0
         counter = self.state.get('counter', 0)
-        records = list(records)
-        for i, record in enumerate(records):
-            print(f'transform record {i} {self._transform_message(record)}')
-            payloads = self._transform(request, record)
-            # print('payloads', payloads)
-            if payloads:
-                if not isinstance(payloads, (tuple, list)):
-                    payloads = (payloads,)
-
-                for payload in payloads:
-                    # print('--- loading')
-                    # print(payload)
-                    # print('-------------')
-                    self._load_record(payload, dry)
-                    cnt += 1
+        concurrency = self._get_concurrency()
+
+        if self._stream:
+            batches = iter_batches(records, self._stream_batch)
+        else:
+            batches = (list(records),)
+
+        # cursors of the rows that were loaded and of the records that failed to load
+        loaded = []
+        failed = []
+        n = 0
+        for batch in batches:
+            if hasattr(self, '_preload'):
+                self._preload(batch)
+
+            if concurrency > 1:
+                fs = self._load_concurrent(request, batch, dry, concurrency, n)
             else:
-                print(f'        skipping {record}')
-            print('-----------------------------------------------')
+                fs = []
+                for i, record in enumerate(batch):
+                    try:
+                        self._load_one(request, n + i, record, dry)
+                    except LoadError as e:
+                        print(f'failed loading record {self._transform_message(record)}. error={e}')
+                        fs.append(record)
+
+            fs = {id(r) for r in fs}
+            for i, record in enumerate(batch):
+                if id(record) in fs:
+                    failed.append(self._get_cursors(record))
+                    if hasattr(self, '_post_load_failed'):
+                        self._post_load_failed(n + i, record)
+                else:
+                    loaded.extend(self._get_cursors(record))
+            n += len(batch)
+
+        self._failed_count = len(failed)
+        cursor = self._encode_cursor(self._get_safe_cursor(loaded, failed))
 
-            # state = {self._cursor_id: record.get(self._cursor_id),
-        state = {self._cursor_id: self._get_latest_cursor(records),
+        # state = {self._cursor_id: record.get(self._cursor_id),
+        state = {self._cursor_id: cursor,
                  'limit': self._limit,
                  'counter': counter + 1
                  }
+        for k in ('concurrency', 'drain_budget'):
+            if k in self.state:
+                state[k] = self.state[k]
 
         print('new state', state)
         self.state = state
+        flush_stores()
         # self.state['counter'] = counter + 1
         return self.state
 
+    def _get_concurrency(self):
+        c = self._concurrency
+        try:
+            c = int(self.state['concurrency'])
+        except (KeyError, ValueError, TypeError):
+            pass
+
+        if not c or c < 1:
+            return 1
+        return min(c, self._max_concurrency)
+
+    def _load_one(self, request, i, record, dry):
+        """
+        transform a record and load its payloads
+
+        :return: int. number of payloads loaded
+        :raises LoadError: if a payload was not loaded. the remaining payloads are still loaded
+        """
+        cnt = 0
+        nfailed = 0
+        print(f'transform record {i} {self._transform_message(record)}')
+        payloads = self._transform(request, record)
+        # print('payloads', payloads)
+        if payloads:
+            if not isinstance(payloads, (tuple, list)):
+                payloads = (payloads,)
+
+            for payload in payloads:
+                # print('--- loading')
+                # print(payload)
+                # print('-------------')
+                obj = self._load_record(payload, dry)
+                if hasattr(self, '_post_load_record'):
+                    self._post_load_record(payload, dry, obj)
+                if not dry and is_failed_load(obj):
+                    nfailed += 1
+                cnt += 1
+        else:
+            print(f'        skipping {record}')
+        print('-----------------------------------------------')
+        if nfailed:
+            raise LoadError(f'failed loading {nfailed}/{cnt} payloads')
+        return cnt
+
+    def _load_concurrent(self, request, records, dry, concurrency, offset=0):
+        """
+        load the records using a pool of concurrency workers.
+
+        a failure only affects the record that raised it
+        :return: list of records that failed to load
+        """
+        print(f'loading {len(records)} records. concurrency={concurrency}')
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(self._load_one, request, offset + i, r, dry) for i, r in enumerate(records)]
+
+        failed = []
+        for record, future in zip(records, futures):
+            e = future.exception()
+            if e is not None:
+                print(f'failed loading record {self._transform_message(record)}. error={e}')
+                failed.append(record)
+        return failed
+
     def _get_cursor(self, record):
         return record.get(self._cursor_id)
 
-    def _get_latest_cursor(self, records):
-        cursors = [self._get_cursor(r) for r in records]
-        cursors = [c for c in cursors if c]
-        if cursors:
-            return max(cursors)
+    def _encode_cursor(self, cursor):
+        """
+        the cursor as it is stored in the state
+        """
+        return cursor
+
+    def _get_cursors(self, record):
+        return [c for c in (self._get_cursor(record),) if c]
+
+    def _get_safe_cursor(self, loaded, failed):
+        """
+        the latest cursor that does not skip over a failed record.
+
+        if a failed record has no cursor the cursor is not advanced
+        :param loaded: list of the cursors of the loaded rows
+        :param failed: list of lists of the cursors of each failed record
+        """
+        if failed:
+            previous = self.state.get(self._cursor_id)
+            if not all(failed):
+                return previous
+
+            lowest = min(c for cs in failed for c in cs)
+            loaded = [c for c in loaded if c < lowest]
+            if not loaded:
+                return previous
+
+        if loaded:
+            return max(loaded)
+
+        # an empty page does not move the cursor
+        return self.state.get(self._cursor_id)
 
     def _load_record(self, payload, dry):
         """
@@ -431,6 +872,8 @@ class BaseSTAO(STAO):
             funcname = f'put_{tag.lower()}'
 
         func = getattr(clt, funcname)
+        if is_data_array(payload):
+            return self._load_data_array(func, payload, dry)
 
         # print(f'calling {funcname} {func} {record}')
         # print(f'dry={dry} load record={record}')
@@ -439,6 +882,32 @@ class BaseSTAO(STAO):
         # print(f'     iotid={obj.iotid}')
         return obj
 
+    def _load_data_array(self, func, payload, dry):
+        """
+        POST a dataArray payload in chunks
+
+        :return: list of the pysta objects returned for each chunk
+        """
+        chunks = list(chunk_rows(payload['observations'], self._observation_chunk_rows,
+                                 self._observation_chunk_bytes))
+        n = len(chunks)
+
+        def load(i, chunk, nbytes):
+            st = time.time()
+            obj = func(dict(payload, observations=chunk), dry=dry)
+            et = max(time.time() - st, 1e-6)
+            print(f'loaded chunk {i + 1}/{n} rows={len(chunk)} bytes={nbytes} '
+                  f'{len(chunk) / et:0.1f} rows/s {nbytes / et / 1024:0.1f} kB/s')
+            return obj
+
+        workers = min(self._observation_chunk_workers or 1, n)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(load, i, c, nb) for i, (c, nb) in enumerate(chunks)]
+            return [f.result() for f in futures]
+        else:
+            return [load(i, c, nb) for i, (c, nb) in enumerate(chunks)]
+
     def _get_elevation(self, record):
         return
 
@@ -465,6 +934,38 @@ class BQSTAO(BaseSTAO):
     _orderby = None
     _join = None
 
+    # fetch the results as a pandas DataFrame through the BigQuery Storage Read API instead of row by row.
+    # requires pyarrow and google-cloud-bigquery-storage. ObservationMixin then works on whole columns
+    _columnar = False
+
+    # dry run each query first and report the bytes it scans. also enabled by the "bq_dry_run" key of the request
+    # state. if _bq_max_bytes is set a query that would scan more bytes raises a ValueError instead of running
+    _bq_dry_run = False
+    _bq_max_bytes = None
+
+    # codec of the _cursor_id state value. see stao.cursor. if None it is inferred from the name of _cursor_id
+    _cursor_codec = None
+
+    def _get_cursor_codec(self):
+        if self._cursor_codec is None:
+            return cursor_factory(self._cursor_id)
+        return self._cursor_codec
+
+    def _get_cursors(self, record):
+        """
+        the cursors of the rows of a record. the state of a paged query must not skip over the rows of a failed record
+        """
+        if hasattr(self, '_get_record_cursors'):
+            return [c for c in self._get_record_cursors(record) if c]
+        return super()._get_cursors(record)
+
+    def _encode_cursor(self, cursor):
+        try:
+            return self._get_cursor_codec().encode(cursor)
+        except (ValueError, TypeError) as e:
+            print(f'failed encoding cursor {cursor}. error={e}')
+            return cursor
+
     def _extract(self, request):
         state = None
         if isinstance(request, dict):
@@ -479,53 +980,16 @@ class BQSTAO(BaseSTAO):
             print('error a {}'.format(e))
             where = None
 
+        params = {}
         if not where:
+            codec = self._get_cursor_codec()
             try:
-                if self._cursor_id in ('OBJECTID', 'id'):
-                    obj = int(state.get(self._cursor_id))
-                    where = f"{self._cursor_id}>{obj}"
-                elif self._cursor_id.endswith('_airbyte_raw_id'):
-                    obj = state.get(self._cursor_id)
-                    where = f"{self._cursor_id}>'{obj}'"
-                else:
-                    obj = state.get(self._cursor_id)
-                    if obj is not None:
-                        if self._cursor_id == 'data_time':
-                            fmt = '%Y-%m-%d %H:%M:%S'
-                            where = f"PARSE_TIMESTAMP('{fmt}', {self._cursor_id})>PARSE_TIMESTAMP('{fmt}', '{obj}')"
-                        else:
-                            if isinstance(obj, str):
-                                try:
-                                    fmt = '%Y-%m-%dT%H:%M:%S.%f%z'
-                                    dt = datetime.datetime.strptime(obj, fmt)
-
-                                    fmt = '%Y-%m-%d %H:%M:%S'
-                                    obj = dt.strftime(fmt)
-                                    where = f"{self._cursor_id}>=PARSE_TIMESTAMP('{fmt}', '{obj}')"
-                                    print('using where clause 1', where)
-                                except ValueError:
-                                    for fmt in ('%a, %d %b %Y %H:%M:%S. %Z',
-                                                '%Y-%m-%dT%H:%M:%E6S%Ez',
-                                                '%Y-%m-%d %H:%M:%S'):
-                                        try:
-                                            _ = datetime.datetime.strptime(obj, fmt)
-                                            where = f"{self._cursor_id}>=PARSE_TIMESTAMP('{fmt}', '{obj}')"
-                                            print('using where clause 2', where)
-                                            break
-                                        except ValueError as e:
-                                            print('valueaesfd', e, self._cursor_id, obj)
-                                            pass
-
-                                #Fri, 14 Jun 2024 01:04:51 GMT
-                                #%a, %d %b %Y %H:%M:%S %Z
-                                # where = f"{self._cursor_id}>PARSE_TIMESTAMP('%a, %d %b %Y %H:%M:%S. %Z', '{obj}')"
-                                # where = f"{self._cursor_id}>{obj}"
-
-                            else:
-                                where = f"{self._cursor_id}>'{obj}'"
+                obj = codec.decode(state.get(self._cursor_id))
+                where, params = codec.predicate(obj)
             except (ValueError, AttributeError, TypeError) as e:
                 print('error b {}'.format(e))
                 where = None
+                params = {}
 
         if self._where:
             if where:
@@ -538,41 +1002,79 @@ class BQSTAO(BaseSTAO):
         except (ValueError, AttributeError, TypeError):
             pass
 
+        try:
+            self._bq_dry_run = bool(state['bq_dry_run'])
+        except (KeyError, TypeError):
+            pass
+
         join = None
         if self._join:
             join = f'join {self._join}'
 
-        print('where {} {}'.format(where, self._limit))
+        print('where {} {} {}'.format(where, params, self._limit))
         return self._handle_extract(self._get_bq_items(self._fields, self._dataset, self._tablename,
-                                                       where=where, join=join, table_name_alias=self._table_name_alias))
+                                                       where=where, join=join, table_name_alias=self._table_name_alias,
+                                                       params=params))
 
     def _bq_query(self, sql, **kw):
-        client = bigquery.Client(
-            project='waterdatainitiative-271000',
-        )
+        client = get_bq_client()
         print(f'BQ Query {sql}')
+        st = time.time()
         job = client.query(sql, **kw)
-        return job.result()
-
-    def _get_bq_items(self, fields, dataset, tablename, where=None, join=None, table_name_alias=None):
-        fs = ','.join(fields)
-        sql = f'select {fs} from {dataset}.{tablename}'
-
-        if table_name_alias:
-            sql = f'{sql} as {table_name_alias}'
-
-        if join:
-            sql = f'{sql} {join} '
-        if where:
-            sql = f'{sql} where {where}'
+        result = job.result()
+        record_bq_query(time.time() - st)
+        print(f'BQ stats {BQ_STATS}')
+        return result
 
-        if self._orderby:
-            sql = f'{sql} order by {self._orderby}'
-
-        if self._limit:
-            sql = f'{sql} limit {self._limit}'
+    def _bq_estimate(self, query):
+        """
+        dry run query. BigQuery validates it and reports the bytes it would scan without running it
 
-        return self._bq_query(sql)
+        :param query: BQQuery
+        :return: int. bytes processed
+        """
+        client = get_bq_client()
+        job = client.query(query.sql(), job_config=query.job_config(dry_run=True))
+        nbytes = job.total_bytes_processed or 0
+        print(f'BQ dry run {nbytes / 1024 ** 2:0.1f} MB processed. {query}')
+        if self._bq_max_bytes and nbytes > self._bq_max_bytes:
+            raise ValueError(f'query would process {nbytes} bytes, more than _bq_max_bytes={self._bq_max_bytes}. '
+                             f'check the cursor. {query}')
+        return nbytes
+
+    def _make_bq_query(self, fields, dataset, tablename, where=None, join=None, table_name_alias=None, params=None):
+        """
+        :return: BQQuery
+        """
+        query = BQQuery(fields, dataset, tablename, alias=table_name_alias, join=join)
+        query.where(where, **(params or {}))
+
+        orderby = self._orderby
+        if orderby is None and self._cursor_codec is not None:
+            # keyset pages must be ordered by the cursor
+            orderby = self._cursor_codec.order_by()
+        query.order_by(orderby)
+        query.limit(self._limit)
+
+        location_field = getattr(self, '_location_field', None)
+        if self._stream and location_field:
+            # let BQ group the page by location so the rows can be streamed
+            query.reorder_by(location_field)
+        return query
+
+    def _get_bq_items(self, fields, dataset, tablename, where=None, join=None, table_name_alias=None, params=None):
+        query = self._make_bq_query(fields, dataset, tablename, where=where, join=join,
+                                    table_name_alias=table_name_alias, params=params)
+        if self._bq_dry_run or self._bq_max_bytes:
+            self._bq_estimate(query)
+
+        print(f'BQ params {query.get_params()}')
+        result = self._bq_query(query.sql(), job_config=query.job_config())
+        if self._columnar:
+            st = time.time()
+            result = result.to_dataframe(create_bqstorage_client=True)
+            print(f'BQ fetched {len(result)} rows columnar in {time.time() - st:0.3f}s')
+        return result
 
     def _handle_extract(self, records):
         return records
@@ -581,6 +1083,14 @@ class BQSTAO(BaseSTAO):
 class DatastreamMixin:
     _entity_tag = 'datastream'
 
+    # the Location property that location.name is matched against. set to None to disable prefetching
+    _location_key_property = 'name'
+
+    def _preload(self, records):
+        if self._location_key_property:
+            names = [self.toST('location.name', r) for r in records]
+            self._get_resolver().prefetch(names, self._location_key_property, getattr(self, '_agency', None))
+
     def _make_datastream_payload(self, record, tag, agency, thing=None):
         if thing is None:
             thing = self._get_thing(record, agency)
@@ -604,15 +1114,13 @@ class DatastreamMixin:
     def _get_thing(self, record, agency):
         print('get thing', record)
         name = self.toST('location.name', record)
-        q = f"name eq '{name}' and properties/agency eq '{agency}'"
-        print(q)
-        loc = self._client.get_location(query=q)
+        resolver = self._get_resolver()
+        loc = resolver.location(name, 'name', agency)
         if not loc:
             print(f'------------ failed locating {name}')
             return
 
-        return self._client.get_thing(location=loc['@iot.id'],
-                                      name=self.toST('thing.name'))
+        return resolver.thing(loc, self.toST('thing.name'))
 
 
 class ThingMixin:
@@ -691,6 +1199,7 @@ class LocationGeoconnexMixin:
         except TypeError:
             print('failed patching location')
             print('payload', payload)
+        return obj
 
 
 class BucketSTAO(BaseSTAO):
@@ -736,7 +1245,16 @@ class BucketSTAO(BaseSTAO):
 
 
 class MultifileBucketSTAO(BaseSTAO):
+    """
+    A STAO for ETLing every blob in a Google Cloud Storage bucket.
+
+    blobs are downloaded _download_workers at a time. each blob is recorded in a BlobManifest once it has been loaded
+    so later runs, including a run resuming after a timeout, only download new or changed blobs.
+    pass {"force": true} in the request to process every blob
+    """
     _bucket_name = 'waterdatainitiative'
+    _download_workers = 4
+    _manifest = None
 
     def render(self, request, dry=False):
         """
@@ -753,11 +1271,36 @@ class MultifileBucketSTAO(BaseSTAO):
             elif request.json:
                 self.state = request.json
 
-        for data in self._get_extracted_data():
+        force = self.state.get('force')
+        blobs = self._get_blobs(force)
+        manifest = self._get_manifest()
+        for i, (blob, data) in enumerate(self._get_extracted_data(blobs)):
+            if isinstance(data, dict):
+                data = [data]
+
             self._load(request, data, dry)
+            if not dry:
+                if self._failed_count:
+                    # not recorded, so the blob is processed again on the next run
+                    print(f'{self._failed_count} records of blob {blob.name} failed to load. not recording the blob')
+                else:
+                    manifest.update(blob)
+                flush_stores()
+
+            self.state.update({'blob': blob.name,
+                               'blobs_processed': i + 1,
+                               'blobs_remaining': len(blobs) - i - 1})
+            if force:
+                self.state['force'] = force
+            print(f'processed blob {blob.name} {i + 1}/{len(blobs)}')
 
         return self.state
 
+    def _get_manifest(self):
+        if self._manifest is None:
+            self._manifest = BlobManifest(self.__class__.__name__)
+        return self._manifest
+
     def _get_bucket(self):
         """
         helper function to grab a bucket from GCS
@@ -769,12 +1312,38 @@ class MultifileBucketSTAO(BaseSTAO):
         client = storage.Client()
         return client.get_bucket(self._bucket_name)
 
-    def _get_extracted_data(self):
+    def _get_blobs(self, force=False):
+        """
+        :return: list of the blobs that are new or have changed since they were last processed
+        """
         bucket = self._get_bucket()
-        blobs = bucket.list_blobs()
-        for blob in blobs:
-            print(f'extracting {blob.name}')
-            yield self._handle_extract(blob.download_as_bytes())
+        blobs = list(bucket.list_blobs())
+        if force:
+            return blobs
+
+        manifest = self._get_manifest()
+        changed = [b for b in blobs if manifest.changed(b)]
+        print(f'{len(changed)}/{len(blobs)} blobs to process in {self._bucket_name}')
+        return changed
+
+    def _get_extracted_data(self, blobs):
+        """
+        download the blobs on a bounded pool of threads, keeping at most _download_workers downloads ahead
+
+        :return: generator of (blob, extracted data) in the order of blobs
+        """
+        n = max(self._download_workers or 1, 1)
+        it = iter(blobs)
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            pending = deque((b, executor.submit(b.download_as_bytes)) for b in islice(it, n))
+            while pending:
+                blob, future = pending.popleft()
+                nblob = next(it, None)
+                if nblob is not None:
+                    pending.append((nblob, executor.submit(nblob.download_as_bytes)))
+
+                print(f'extracting {blob.name}')
+                yield blob, self._handle_extract(future.result())
 
     def _handle_extract(self, blobcontent):
         """
@@ -63,29 +63,31 @@ class BernCoLocations(LocationGeoconnexMixin, LocationMixin, SiteSTAO):
 
 class BernCoThings(SiteSTAO):
     _entity_tag = 'thing'
+    _property_paths = ['thing.properties.ose_permit',
+                       'thing.properties.nmbgmr_id',
+                       'thing.properties.well_uuid',
+                       'thing.properties.aquifer_code',
+                       'thing.properties.casing_stickup',
+                       'thing.properties.screen_interval',
+                       'thing.properties.well_depth']
 
     def _transform(self, request, record):
         name = self.toST('location.name', record)
 
         location = self._client.get_location(f"name eq '{name}'")
+        properties = {'agency': AGENCY}
+        properties.update(self.toST_many(record, self._property_paths))
         payload = {'name': WATER_WELL['name'],
                    'Locations': [{'@iot.id': location['@iot.id']}],
                    'description': WATER_WELL['description'],
-                   'properties': {'agency': AGENCY,
-                                  'ose_permit': self.toST('thing.properties.ose_permit', record),
-                                    'nmbgmr_id': self.toST('thing.properties.nmbgmr_id', record),
-                                    'well_uuid': self.toST('thing.properties.well_uuid', record),
-                                    'aquifer_code': self.toST('thing.properties.aquifer_code', record),
-                                    'casing_stickup': self.toST('thing.properties.casing_stickup', record),
-                                    'screen_interval': self.toST('thing.properties.screen_interval', record),
-                                    'well_depth': self.toST('thing.properties.well_depth', record),
-                                  }
+                   'properties': properties
                    }
 
         return payload
 
 
 class BernCoWellDatastreams(DatastreamMixin, SiteSTAO):
+    _agency = AGENCY
 
     def _transform(self, request, record):
         payload = self._make_datastream_payload(record, 'manual', AGENCY)
@@ -15,19 +15,18 @@
 # ===============================================================================
 import csv
 import urllib.request
-from datetime import datetime
 from itertools import groupby
 
 import httpx
 from sta.definitions import FOOT, OM_Measurement
-from sta.util import statime
 
 from stao.base_stao import BucketSTAO, ObservationMixin, BaseSTAO
 from stao.ckan_stao import CKANResourceSTAO
 from stao.constants import ENCODING_GEOJSON, WATER_WELL, NO_DESCRIPTION, DTW_OBS_PROP, ELEV_OBS_PROP, MANUAL_SENSOR, \
     WATER_QUANTITY, GWL_DS, GWE_DS
 from stao.ose_roswell_basin.entities import CKANSTAO
-from stao.util import make_geometry_point_from_latlon, copy_properties, asiotid
+from stao.timestamps import parse_timestamps, format_timestamps
+from stao.util import make_geometry_point_from_latlon, copy_properties, asiotid, unique_records
 
 # try:
 #     from stao import BucketSTAO, ObservationMixin
@@ -47,6 +46,9 @@ AGENCY = 'CABQ'
 class CABQSTAO(CKANResourceSTAO):
     dataset_names = 'Well Construction'
     resource_id = '8770b6eb-a958-4f2e-a901-f64f38ef25e9'
+
+    # the Well Construction sheet has a row per screen. merge them into one record per well. see unique_records
+    _unique_mode = 'merge'
 # class CABQSTAO(BucketSTAO):
 #     _blobs = [
 #               'cabq/COA_WaterLevels_All.txt',
@@ -66,17 +68,8 @@ class CABQSTAO(CKANResourceSTAO):
     #             yield from self._extract_hook(reader)
 
     def _extract_hook(self, resource, records):
-        yielded = []
-        for row in records:
-            name = row['sys_loc_code']
-            if name in yielded:
-                continue
-
-            if row['is_well'].strip().lower() != 'y':
-                continue
-
-            yielded.append(name)
-            yield row
+        records = (row for row in records if row['is_well'].strip().lower() == 'y')
+        return unique_records(records, 'sys_loc_code', self._unique_mode)
 
 
 class CABQLocations(CABQSTAO):
@@ -114,6 +107,23 @@ class CABQLocations(CABQSTAO):
 class CABQThings(CABQSTAO):
     _entity_tag = 'thing'
 
+    def _get_screens(self, record):
+        screens = []
+        seen = set()
+        for row in record.get('rows', (record,)):
+            screen = {}
+            for k, attr in (('ScreenTop', 'start_depth'), ('ScreenBottom', 'end_depth')):
+                try:
+                    screen[k] = float(row.get(attr))
+                except (TypeError, ValueError):
+                    screen[k] = 0
+
+            key = (screen['ScreenTop'], screen['ScreenBottom'])
+            if key not in seen:
+                seen.add(key)
+                screens.append(screen)
+        return screens
+
     def _transform(self, request, record):
         def asfloat(attr):
             v = record[attr]
@@ -130,10 +140,7 @@ class CABQThings(CABQSTAO):
                       'stickup_height': {'value': asfloat('stickup_height'),
                                        'unit': record['stickup_unit']},
                       'remark': record['well_remark'],
-                      'screens': [
-                          {'ScreenTop': asfloat('start_depth'),
-                           'ScreenBottom': asfloat('end_depth'),}
-                        ],
+                      'screens': self._get_screens(record),
                       'casing_inner_diameter': asfloat('inner_diameter'),
                       'casing_outer_diameter': asfloat('outer_diameter'),
                       'casing_material': record['material_type_code'],
@@ -171,12 +178,14 @@ class CABQThings(CABQSTAO):
 class CABQDatastreams(CABQSTAO):
     _entity_tag = 'datastream'
 
+    def _preload(self, records):
+        self._get_resolver().prefetch([r['sys_loc_code'] for r in records], 'name', AGENCY)
+
     def _transform(self, request, record):
-        loc = self._client.get_location(f"name eq '{record['sys_loc_code']}' and properties/agency eq '{AGENCY}'")
+        resolver = self._get_resolver()
+        loc = resolver.location(record['sys_loc_code'], 'name', AGENCY)
         if loc:
-            lid = loc['@iot.id']
-
-            thing = self._client.get_thing(name=WATER_WELL['name'], location=lid)
+            thing = resolver.thing(loc, WATER_WELL['name'])
             if thing:
                 obsprop = next(self._client.get_observed_properties(name=DTW_OBS_PROP['name']))
                 welev_obsprop = next(self._client.get_observed_properties(name=ELEV_OBS_PROP['name']))
@@ -215,6 +224,12 @@ class CABQObservations(CABQSTAO, ObservationMixin):
     _name = None
     # resource_name = 'Water Levels'
     dataset_names = 'Water Levels'
+    _location_key_property = 'name'
+    _timestamp_formats = ('%m/%d/%Y  %H:%M',)
+
+    def _get_location_key(self, record):
+        return record['sys_loc_code']
+
     def _extract_hook(self, resource, records):
         def key(r):
             return r['sys_loc_code']
@@ -224,17 +239,21 @@ class CABQObservations(CABQSTAO, ObservationMixin):
             yield {'sys_loc_code': g, 'observations': obs}
 
     def _transform(self, request, record):
-        loc = self._client.get_location(name=record['sys_loc_code'])
+        resolver = self._get_resolver()
+        loc = resolver.location(record['sys_loc_code'], 'name')
         if loc:
-            thing = self._client.get_thing(name='Water Well', location=loc['@iot.id'])
+            thing = resolver.thing(loc, 'Water Well')
             if thing:
-                ds = self._client.get_datastream(name=self._name, thing=thing['@iot.id'])
+                ds = resolver.datastream(thing, self._name)
                 vs = []
                 components = ['phenomenonTime', 'resultTime', 'result', 'parameters']
-                for obs in record['observations']:
-                    ts = obs['measurement_date']
-                    ts = datetime.strptime(ts, '%m/%d/%Y  %H:%M')
-                    t = statime(ts.isoformat())
+                observations = record['observations']
+                timestamps = parse_timestamps((obs['measurement_date'] for obs in observations),
+                                              self._timestamp_formats, key=('CABQObservations', 'measurement_date'))
+                for obs, t in zip(observations, format_timestamps(timestamps)):
+                    if t is None:
+                        print(f'skipping invalid datetime. {obs["measurement_date"]}')
+                        continue
 
                     v = obs[self._attr]
                     parameters = {'measurement_method': obs['measurement_method'],
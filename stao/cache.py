@@ -0,0 +1,214 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+cache.py  Process wide cache for SensorThings entity lookups
+
+The cache is a module level object so it survives across invocations of a warm Cloud Functions instance
+"""
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+# rows per CreateObservations POST made by pysta.Client.add_observations
+OBSERVATIONS_CHUNK = 100
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per entry expiry
+    """
+
+    def __init__(self, maxsize=4096, ttl=900, negative_ttl=60):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: cached value or MISSING
+        """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return MISSING
+
+            if expires < time.time():
+                del self._data[key]
+                return MISSING
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        cache value. None is cached as a miss using the shorter negative_ttl
+        """
+        ttl = self._negative_ttl if value is None else self._ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, tag):
+        """
+        remove all the entries whose key starts with tag
+        """
+        with self._lock:
+            for k in [k for k in self._data if k[:len(tag)] == tag]:
+                del self._data[k]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+ENTITY_CACHE = TTLCache()
+
+
+class CachingClient:
+    """
+    Wraps a pysta.Client and memoizes the entity lookups.
+
+    creating or patching an entity through the wrapper invalidates the cached lookups for that entity type.
+    all other attributes are passed through to the wrapped client
+    """
+
+    def __init__(self, client, cache=None):
+        self._client = client
+        self._cache = ENTITY_CACHE if cache is None else cache
+
+    def __getattr__(self, item):
+        return getattr(self._client, item)
+
+    def _tag(self, tag):
+        return self._client.base_url, tag
+
+    def _cached(self, tag, key, func):
+        k = self._tag(tag) + (key,)
+        v = self._cache.get(k)
+        if v is MISSING:
+            v = func()
+            self._cache.set(k, v)
+        return v
+
+    def _load(self, func, tag, payload, dry):
+        obj = func(payload, dry=dry)
+        self._cache.invalidate(self._tag(tag))
+        return obj
+
+    # lookups
+    def get_location(self, query=None, name=None):
+        return self._cached('location', (query, name), lambda: self._client.get_location(query=query, name=name))
+
+    def get_thing(self, query=None, name=None, location=None):
+        if isinstance(location, dict):
+            location = location['@iot.id']
+
+        def func():
+            try:
+                return self._client.get_thing(query=query, name=name, location=location)
+            except StopIteration:
+                return
+
+        thing = self._cached('thing', (query, name, location), func)
+        if thing is None:
+            raise StopIteration
+        return thing
+
+    def get_datastream(self, query=None, name=None, thing=None):
+        if isinstance(thing, dict):
+            thing = thing['@iot.id']
+
+        def func():
+            try:
+                return self._client.get_datastream(query=query, name=name, thing=thing)
+            except StopIteration:
+                return
+
+        ds = self._cached('datastream', (query, name, thing), func)
+        if ds is None:
+            raise StopIteration
+        return ds
+
+    def get_sensors(self, query=None, name=None):
+        items = self._cached('sensor', (query, name),
+                             lambda: list(self._client.get_sensors(query=query, name=name)) or None)
+        yield from items or ()
+
+    def get_observed_properties(self, query=None, name=None):
+        items = self._cached('observed_property', (query, name),
+                             lambda: list(self._client.get_observed_properties(query=query, name=name)) or None)
+        yield from items or ()
+
+    # loads
+    def add_observations(self, payload, dry=False):
+        """
+        POST a dataArray payload with pysta.Client.add_observations.
+
+        pysta does not report failed POSTs, so the last row of each CreateObservations chunk is read back afterwards.
+        this returns None if any chunk was not loaded
+        """
+        obs = self._client.add_observations(payload, dry=dry)
+        if dry:
+            return obs
+
+        rows = payload['observations']
+        chunks = range(OBSERVATIONS_CHUNK - 1, len(rows) + OBSERVATIONS_CHUNK - 1, OBSERVATIONS_CHUNK)
+        missing = [i for i in chunks if not self._observation_exists(payload, rows[min(i, len(rows) - 1)])]
+        if missing:
+            print(f'failed loading {len(missing)}/{len(chunks)} observation chunks. '
+                  f'datastream={payload["Datastream"]}')
+            return
+
+        return obs
+
+    def _observation_exists(self, payload, row):
+        """
+        True if the datastream of payload has an observation matching row, a dataArray row of payload
+        """
+        row = dict(zip(payload['components'], row))
+        q = f"phenomenonTime eq {row['phenomenonTime']} and result eq {row['result']}"
+        entity = f"Datastreams({payload['Datastream']['@iot.id']})/Observations"
+        return any(True for _ in self._client.get_datastreams(q, entity=entity, limit=1))
+
+    def put_location(self, payload, dry=False):
+        return self._load(self._client.put_location, 'location', payload, dry)
+
+    def patch_location(self, iotid, payload, dry=False):
+        obj = self._client.patch_location(iotid, payload, dry=dry)
+        self._cache.invalidate(self._tag('location'))
+        return obj
+
+    def put_thing(self, payload, dry=False):
+        return self._load(self._client.put_thing, 'thing', payload, dry)
+
+    def put_datastream(self, payload, dry=False):
+        return self._load(self._client.put_datastream, 'datastream', payload, dry)
+
+    def put_sensor(self, payload, dry=False):
+        return self._load(self._client.put_sensor, 'sensor', payload, dry)
+
+    def put_observed_property(self, payload, dry=False):
+        return self._load(self._client.put_observed_property, 'observed_property', payload, dry)
+# ============= EOF =============================================
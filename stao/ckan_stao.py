@@ -13,33 +13,307 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
+import asyncio
+import codecs
 import csv
+import hashlib
+import io
 import json
+import threading
 
 import httpx
 
 from stao.base_stao import BaseSTAO
+from stao.store import store_factory
 
 
-class CKANSTAO(BaseSTAO):
+def split_lines(text):
+    """
+    split text into lines the way csv sees a file opened with newline=''. only \n, \r and \r\n end a line,
+    unlike str.splitlines. the line endings are kept
+    """
+    return io.StringIO(text, newline='').readlines()
+
+
+class ResourcePrefetcher:
+    """
+    download resources ahead of use with an async httpx client running on a background event loop.
+
+    at most max_connections requests are in flight at once
+    """
+
+    def __init__(self, max_connections=4):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client = self._call(self._make_client(max_connections))
+        self._futures = {}
+
+    async def _make_client(self, max_connections):
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        return httpx.AsyncClient(limits=limits, follow_redirects=True, timeout=60)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, key, url, headers=None):
+        if key not in self._futures:
+            self._futures[key] = asyncio.run_coroutine_threadsafe(self._client.get(url, headers=headers),
+                                                                  self._loop)
+
+    def pop(self, key):
+        """
+        :return: the httpx.Response for key or None if key was not submitted
+        """
+        future = self._futures.pop(key, None)
+        if future is not None:
+            return future.result()
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+        self._call(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class ResourceCacheMixin:
+    """
+    skip CKAN resources that have not changed since this STAO last loaded them.
+
+    the etag, last modified and sha256 of each downloaded resource are kept in the store under
+    "ckan:<STAO class>:<resource id>" and committed only after render succeeds and none of the resource's records
+    failed to load. pass {"force": true} in the request to load unchanged resources
+    """
+    _use_resource_cache = True
+    _resource_cache = None
+    _pending_resources = None
+    _prefetcher = None
+
+    # (index of the first extracted record, cache key) of each resource in extraction order
+    _resource_offsets = None
+    # cache keys of the resources with records that failed to load. None if the resource is not known
+    _failed_resources = None
+
+    def render(self, request, dry=False):
+        self._pending_resources = {}
+        self._resource_offsets = []
+        self._failed_resources = set()
+        resp = super(ResourceCacheMixin, self).render(request, dry=dry)
+        if not dry:
+            self._commit_resources()
+        return resp
+
+    def _mark_resource(self, resource, index):
+        """
+        the records extracted from index on belong to resource
+        """
+        if self._resource_offsets is not None:
+            self._resource_offsets.append((index, self._get_resource_key(resource)))
+
+    def _post_load_failed(self, index, record):
+        key = None
+        for start, k in self._resource_offsets or ():
+            if start > index:
+                break
+            key = k
+
+        if self._failed_resources is not None:
+            self._failed_resources.add(key)
+
+    def _get_resource_cache(self):
+        if self._resource_cache is None:
+            self._resource_cache = store_factory()
+        return self._resource_cache
+
+    def _commit_resources(self):
+        if self._pending_resources:
+            failed = self._failed_resources or set()
+            if None in failed:
+                print('records failed to load. not caching any resource')
+                self._pending_resources = {}
+                return
+
+            cache = self._get_resource_cache()
+            for key, entry in self._pending_resources.items():
+                if key in failed:
+                    # not cached, so the resource is loaded again on the next run
+                    print(f'resource {key} had records that failed to load. not caching')
+                    continue
+                cache.set(key, entry)
+            cache.flush()
+            self._pending_resources = {}
+
+    def _stage_resource(self, key, entry):
+        if self._pending_resources is not None:
+            self._pending_resources[key] = entry
+
+    def _prefetch_resource(self, resource):
+        """
+        start downloading resource in the background. see ResourcePrefetcher
+        """
+        checked = self._check_resource(resource, verbose=False)
+        if checked is not None:
+            key, entry, headers = checked
+            self._prefetcher.submit(key, resource['url'], headers)
+
+    def _get_prefetched(self, key):
+        if self._prefetcher is not None:
+            return self._prefetcher.pop(key)
+
+    def _check_resource(self, resource, verbose=True):
+        """
+        :param resource: dict. CKAN resource metadata from resource_show or package_show
+        :return: (cache key, cache entry, conditional request headers) or None if the resource is unchanged
+        """
+        rid = resource.get('id') or resource['url']
+        key = self._get_resource_key(resource)
+
+        entry = None
+        if self._use_resource_cache and not self.state.get('force'):
+            entry = self._get_resource_cache().get(key)
+
+        last_modified = resource.get('last_modified')
+        if entry and last_modified and entry.get('last_modified') == last_modified:
+            if verbose:
+                print(f'resource {rid} unchanged since {last_modified}. skipping')
+            return
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('http_last_modified'):
+                headers['If-Modified-Since'] = entry['http_last_modified']
+        return key, entry, headers
+
+    def _get_resource_key(self, resource):
+        rid = resource.get('id') or resource['url']
+        return f'ckan:{self.__class__.__name__}:{rid}'
+
+    def _make_resource_entry(self, resource, resp, sha):
+        return {'etag': resp.headers.get('etag'),
+                'http_last_modified': resp.headers.get('last-modified'),
+                'last_modified': resource.get('last_modified'),
+                'sha256': sha}
+
+    def _fetch_resource(self, resource, attr='text'):
+        """
+        download a resource unless it is unchanged since it was last loaded
+
+        :param resource: dict. CKAN resource metadata from resource_show or package_show
+        :param attr: str. attribute of the response to return. e.g. "text" or "content"
+        :return: the response attribute or None if the resource is unchanged
+        """
+        checked = self._check_resource(resource)
+        if checked is None:
+            return
+
+        key, entry, headers = checked
+        resp = self._get_prefetched(key)
+        if resp is None:
+            resp = httpx.get(resource['url'], headers=headers, follow_redirects=True)
+        return self._handle_resource_response(resource, key, entry, resp, attr)
+
+    def _handle_resource_response(self, resource, key, entry, resp, attr):
+        if resp.status_code == 304:
+            print(f'resource {key} not modified. skipping')
+            return
+
+        if not resp.is_success:
+            # not staged, so the resource is downloaded again on the next run
+            print(f'resource {key} failed. status={resp.status_code}. skipping')
+            return
+
+        sha = hashlib.sha256(resp.content).hexdigest()
+        self._stage_resource(key, self._make_resource_entry(resource, resp, sha))
+        if entry and entry.get('sha256') == sha:
+            print(f'resource {key} content unchanged. skipping')
+            return
+
+        return getattr(resp, attr)
+
+    def _open_resource(self, resource):
+        """
+        stream a resource unless it is unchanged since it was last loaded
+
+        the content hash is recorded once the resource has been read to the end. an unchanged hash can only be
+        reported, not skipped, because the lines have already been consumed
+        :return: generator of decoded lines or None if the resource is unchanged. the generator yields nothing if
+        the server reports the resource is not modified or the request fails
+        """
+        checked = self._check_resource(resource)
+        if checked is None:
+            return
+
+        key, entry, headers = checked
+        resp = self._get_prefetched(key)
+        if resp is not None:
+            text = self._handle_resource_response(resource, key, entry, resp, 'text')
+            if text is not None:
+                return iter(io.StringIO(text.lstrip('\ufeff'), newline=''))
+            return
+
+        return self._iter_lines(resource, key, entry, headers)
+
+    def _iter_lines(self, resource, key, entry, headers):
+        """
+        stream the resource. the response is opened and closed inside the generator
+        """
+        with httpx.stream('GET', resource['url'], headers=headers, follow_redirects=True) as resp:
+            if resp.status_code == 304:
+                print(f'resource {key} not modified. skipping')
+                return
+
+            if not resp.is_success:
+                print(f'resource {key} failed. status={resp.status_code}. skipping')
+                return
+
+            encoding = resp.encoding or 'utf-8'
+            if encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+                encoding = 'utf-8-sig'
+
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            h = hashlib.sha256()
+            buf = ''
+            for chunk in resp.iter_bytes():
+                h.update(chunk)
+                lines = split_lines(buf + decoder.decode(chunk))
+                # the last line may continue in the next chunk. a trailing \r may be the first half of \r\n
+                buf = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+                yield from lines
+
+            yield from split_lines(buf + decoder.decode(b'', final=True))
+
+            sha = h.hexdigest()
+            self._stage_resource(key, self._make_resource_entry(resource, resp, sha))
+            if entry and entry.get('sha256') == sha:
+                print(f'resource {key} content unchanged')
+
+
+class CKANSTAO(ResourceCacheMixin, BaseSTAO):
     resource_id = ''
     ckan_url = ''
     def _get_dict_iter(self):
-        blob = self._get_blob()
-        header = None
+        lines = self._get_lines()
+        if lines is None:
+            return
 
-        for line in blob.split('\n'):
-            line = line.strip()
-            if line:
-                line = line.split(',')
+        header = None
+        for row in csv.reader(lines):
+            if not any(row):
+                continue
 
-                if not header:
-                    header = [h.lower() for h in line]
-                    continue
-                yield dict(zip(header, line))
+            if not header:
+                header = [h.strip().lower() for h in row]
+                continue
+            yield dict(zip(header, row))
 
     def _extract(self, request):
-        yielded = []
+        yielded = set()
         for record in self._get_dict_iter():
             record = self._extract_hook(yielded, record)
             if record:
@@ -48,22 +322,25 @@ class CKANSTAO(BaseSTAO):
     def _extract_hook(self, yielded, record):
         return record
 
-    def _get_blob(self):
+    def _get_lines(self):
         url = f'https://catalog.newmexicowaterdata.org/api/3/action/resource_show?id={self.resource_id}'
         # url = f'{self.ckan_url}datastore/dump/{self.resource_id}'
         # print(url)
         resp = httpx.get(url)
         # print(resp)
         # print(resp.json())
-        resp = httpx.get(resp.json()['result']['url'])
-        return resp.text
+        return self._open_resource(resp.json()['result'])
 
 
-class CKANResourceSTAO(BaseSTAO):
+class CKANResourceSTAO(ResourceCacheMixin, BaseSTAO):
     dataset_names = None
     resource_id = None
     excluded_dataset_names = None
 
+    # number of resources downloaded ahead of the one being transformed and loaded. 0 disables prefetching
+    _prefetch_depth = 4
+    _prefetch_connections = 4
+
     def _get_datasets(self):
         url = f'https://catalog.newmexicowaterdata.org/api/3/action/package_show?id={self.resource_id}'
         resp = httpx.get(url, follow_redirects=True)
@@ -91,11 +368,33 @@ class CKANResourceSTAO(BaseSTAO):
         return resources
 
     def _extract(self, request):
+        datasets = self._get_datasets()
+        depth = self._prefetch_depth
+        if depth and len(datasets) > 1:
+            self._prefetcher = ResourcePrefetcher(self._prefetch_connections)
 
-        for dataset in self._get_datasets():
-            print(dataset['name'])
-            records = self._get_dataset_records(dataset)
-            yield from self._extract_hook(dataset, records)
+        n = 0
+        try:
+            for i, dataset in enumerate(datasets):
+                if self._prefetcher is not None:
+                    # keep the next depth resources downloading while this one is transformed and loaded
+                    ahead = datasets[:depth + 1] if i == 0 else datasets[i + depth:i + depth + 1]
+                    for resource in ahead:
+                        self._prefetch_resource(resource)
+
+                print(dataset['name'])
+                records = self._get_dataset_records(dataset)
+                if records is None:
+                    continue
+
+                self._mark_resource(dataset, n)
+                for record in self._extract_hook(dataset, records):
+                    n += 1
+                    yield record
+        finally:
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+                self._prefetcher = None
 
         # for resource in self._get_resources():
         #     records = self._get_resource_records(resource)
@@ -103,14 +402,14 @@ class CKANResourceSTAO(BaseSTAO):
         # yield from self._extract_hook(records)
 
     def _get_dataset(self, dataset, attr ='text'):
-        url = dataset['url']
-        resp = httpx.get(url, follow_redirects=True)
-        # print(resp.text)
-        return getattr(resp, attr)
+        return self._fetch_resource(dataset, attr)
 
     def _get_dataset_records(self, dataset):
-        data = self._get_dataset(dataset)
-        reader = csv.DictReader(data.split('\n'), delimiter=',')
+        lines = self._open_resource(dataset)
+        if lines is None:
+            return
+
+        reader = csv.DictReader(lines, delimiter=',')
         return reader
 
     def _extract_hook(self, dataset, records):
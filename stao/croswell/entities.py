@@ -97,6 +97,7 @@ class CityRoswellObservationSTAO(ObservationMixin, CityRoswellBucketSTAO):
     _timestamp_field = 'Unnamed: 3'
     _value_field = 'depth_to_water'
     _datastream_name = GWL_DS['name']
+    _location_key_property = None
 
         # def key(r):
         #     print(r)
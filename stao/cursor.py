@@ -0,0 +1,250 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+cursor.py  Typed cursor codecs for keyset pagination
+
+A codec converts a cursor between its python value and its JSON state and generates the predicate for the next page.
+unique columns are compared with ">". a plain timestamp is not unique, so it is compared with ">=" and the rows at the
+boundary are read again. use a CompositeCursor with a unique tiebreaker column to page a timestamp exactly
+
+    codec = IntCursor('OBJECTID')
+    state = {'OBJECTID': codec.encode(1234)}
+    where, params = codec.predicate(codec.decode(state['OBJECTID']))
+    # "OBJECTID > @cursor", {"cursor": 1234}
+"""
+import datetime
+from email.utils import parsedate_to_datetime
+
+
+class CursorCodec:
+    """
+    cursor on a single column
+    """
+    # comparison of the predicate. ">" skips rows that share the cursor value with the last row of a page, so only
+    # use it for unique columns
+    op = '>'
+
+    def __init__(self, column):
+        self.column = column
+
+    def encode(self, value):
+        """
+        :return: JSON serializable value stored in the state
+        """
+        if value is None:
+            return
+        return self._encode(self.decode(value))
+
+    def decode(self, value):
+        """
+        :return: python value of a cursor read from the state or from a row. None if the cursor is not set
+        """
+        if value is None or value == '':
+            return
+        return self._decode(value)
+
+    def predicate(self, value, name='cursor'):
+        """
+        :return: (where clause, query parameters). (None, {}) if value is None
+        """
+        if value is None:
+            return None, {}
+        return f'{self.column_expr()} {self.op} {self.param_expr(name)}', {name: self.param_value(value)}
+
+    def order_by(self):
+        return f'{self.column} asc'
+
+    def column_expr(self):
+        return self.column
+
+    def param_expr(self, name):
+        return f'@{name}'
+
+    def param_value(self, value):
+        return value
+
+    def _encode(self, value):
+        return value
+
+    def _decode(self, value):
+        return value
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.column})'
+
+
+class IntCursor(CursorCodec):
+    def _decode(self, value):
+        return int(value)
+
+
+class StringCursor(CursorCodec):
+    def _decode(self, value):
+        return str(value)
+
+
+class TimestampCursor(CursorCodec):
+    """
+    cursor on a TIMESTAMP column. stored as an ISO 8601 string with microseconds, the precision of a BQ TIMESTAMP
+
+    many rows can share a timestamp and a page limit can fall between them, so the rows at the cursor are read again.
+    ObservationMixin drops the observations that are already loaded
+    """
+    op = '>='
+
+    def _encode(self, value):
+        return value.isoformat(timespec='microseconds')
+
+    def _decode(self, value):
+        if isinstance(value, datetime.datetime):
+            dt = value
+        elif isinstance(value, str):
+            try:
+                dt = datetime.datetime.fromisoformat(value)
+            except ValueError:
+                # state returned by a Cloud Function has datetimes serialized as HTTP dates.
+                # e.g. Fri, 14 Jun 2024 01:04:51 GMT
+                dt = parsedate_to_datetime(value)
+        else:
+            raise ValueError(f'invalid timestamp cursor {value}')
+
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return dt.astimezone(datetime.timezone.utc)
+
+
+class StringTimestampCursor(StringCursor):
+    """
+    cursor on a STRING column of timestamps formatted with fmt. e.g. EBID data_time
+
+    the values are stored as they are and compared as timestamps
+    """
+
+    def __init__(self, column, fmt='%Y-%m-%d %H:%M:%S'):
+        super().__init__(column)
+        self.fmt = fmt
+
+    def _decode(self, value):
+        if isinstance(value, datetime.datetime):
+            return value.strftime(self.fmt)
+        return str(value)
+
+    def column_expr(self):
+        return f"PARSE_TIMESTAMP('{self.fmt}', {self.column})"
+
+    def param_expr(self, name):
+        return f"PARSE_TIMESTAMP('{self.fmt}', @{name})"
+
+    def order_by(self):
+        return f'{self.column_expr()} asc'
+
+
+class CompositeCursor:
+    """
+    cursor on several columns compared in order. e.g. (extraction timestamp, row id)
+
+    the value is a tuple and the state a list
+    """
+
+    def __init__(self, *codecs):
+        self.codecs = codecs
+
+    def encode(self, value):
+        if value is None:
+            return
+        return [c.encode(v) for c, v in zip(self.codecs, self.decode(value))]
+
+    def get_row_cursor(self, row):
+        """
+        :param row: dict or BQ Row
+        :return: tuple
+        """
+        return tuple(row[c] for c in self.names)
+
+    @property
+    def names(self):
+        return [c.column.split('.')[-1] for c in self.codecs]
+
+    def decode(self, value):
+        """
+        a single value is the cursor of a state written before the cursor was composite. it is decoded as the first
+        column with the remaining columns None
+        """
+        if value is None or value == '':
+            return
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        if len(value) > len(self.codecs):
+            raise ValueError(f'invalid composite cursor {value}')
+
+        value = list(value) + [None] * (len(self.codecs) - len(value))
+        return tuple(c.decode(v) for c, v in zip(self.codecs, value))
+
+    def predicate(self, value, name='cursor'):
+        """
+        (a, b) > (x, y) expanded to a > x or (a = x and b > y). BQ does not compare STRUCTs
+
+        if the trailing values are None the last known column is compared with ">=" so no rows are skipped
+        """
+        if value is None or value[0] is None:
+            return None, {}
+
+        params = {}
+        exprs = []
+        for i, (c, v) in enumerate(zip(self.codecs, value)):
+            if v is None:
+                break
+            pname = f'{name}_{i}'
+            params[pname] = c.param_value(v)
+            exprs.append((c.column_expr(), c.param_expr(pname)))
+
+        partial = len(exprs) < len(self.codecs)
+        terms = []
+        for i, (col, p) in enumerate(exprs):
+            eqs = [f'{ecol} = {ep}' for ecol, ep in exprs[:i]]
+            op = '>=' if partial and i == len(exprs) - 1 else '>'
+            terms.append(' and '.join(eqs + [f'{col} {op} {p}']))
+
+        clause = ' or '.join(f'({t})' for t in terms)
+        return f'({clause})', params
+
+    def order_by(self):
+        return ','.join(c.order_by() for c in self.codecs)
+
+    @property
+    def column(self):
+        return tuple(c.column for c in self.codecs)
+
+    def __repr__(self):
+        return f'CompositeCursor{self.codecs}'
+
+
+def cursor_factory(cursor_id):
+    """
+    the codec for a cursor column inferred from its name
+
+    :param cursor_id: str. column name
+    :return: CursorCodec
+    """
+    name = cursor_id.split('.')[-1]
+    if name in ('OBJECTID', 'id'):
+        return IntCursor(cursor_id)
+    elif name.endswith('_airbyte_raw_id'):
+        return StringCursor(cursor_id)
+    elif name == 'data_time':
+        return StringTimestampCursor(cursor_id)
+    return TimestampCursor(cursor_id)
+# ============= EOF =============================================
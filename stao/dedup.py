@@ -0,0 +1,120 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+dedup.py  Duplicate detection for observations already stored in a Datastream
+
+"""
+import calendar
+
+from stao.timestamps import parse_timestamps, epoch_seconds, ST_FORMATS
+from stao.util import make_statime
+
+
+def epoch_key(dt):
+    """
+    normalize a datetime to integer seconds since the epoch.
+
+    naive datetimes are assumed to be UTC
+    :param dt: datetime
+    :return: int
+    """
+    return calendar.timegm(dt.utctimetuple())
+
+
+class ObservationIndex:
+    """
+    Hash index of (phenomenonTime, result) pairs.
+
+    build once per datastream from the existing observations and use `in` to check if an incoming observation
+    is a duplicate.
+
+    idx = ObservationIndex.from_observations(client.get_observations(ds))
+    if (dt, v) in idx:
+        ...
+    """
+
+    def __init__(self, precision=6):
+        self._precision = precision
+        self._keys = set()
+
+    @classmethod
+    def from_observations(cls, observations, **kw):
+        """
+        :param observations: iterable of ST observation dicts
+        :return: ObservationIndex
+        """
+        idx = cls(**kw)
+        observations = list(observations)
+        timestamps = parse_timestamps((o['phenomenonTime'] for o in observations), ST_FORMATS,
+                                      key=('ObservationIndex', 'phenomenonTime'))
+        for epoch, o in zip(epoch_seconds(timestamps), observations):
+            if epoch is not None:
+                idx._keys.add(idx._make_epoch_key(epoch, o['result']))
+        return idx
+
+    def add(self, dt, v):
+        if dt is None:
+            return
+        self._keys.add(self._make_key(dt, v))
+
+    def _make_key(self, dt, v):
+        return self._make_epoch_key(epoch_key(dt), v)
+
+    def _make_epoch_key(self, epoch, v):
+        if isinstance(v, float):
+            v = round(v, self._precision)
+        return epoch, v
+
+    def __contains__(self, item):
+        dt, v = item
+        if dt is None:
+            return False
+        return self._make_key(dt, v) in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+if __name__ == '__main__':
+    # benchmark batch dedup time versus datastream size. half of each batch are duplicates
+    import datetime
+    import random
+    import time
+
+    batch = 500
+    t0 = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    for n in (1000, 10000, 50000):
+        existing = [{'phenomenonTime': (t0 + datetime.timedelta(minutes=15 * i)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                     'result': round(random.random() * 100, 2)} for i in range(n)]
+        incoming = [(make_statime(e['phenomenonTime']), e['result']) for e in random.sample(existing, batch // 2)]
+        incoming += [(t0 - datetime.timedelta(minutes=i), 0.0) for i in range(batch // 2)]
+
+        eeobs = [(make_statime(e['phenomenonTime']), e['result']) for e in existing]
+        st = time.time()
+        nlist = sum(1 for dt, v in incoming if any(e[0] == dt and e[1] == v for e in eeobs))
+        tlist = time.time() - st
+
+        st = time.time()
+        idx = ObservationIndex.from_observations(existing)
+        tbuild = time.time() - st
+
+        st = time.time()
+        nidx = sum(1 for item in incoming if item in idx)
+        tidx = time.time() - st
+
+        print(f'existing={n:>6} batch={batch} list_scan={tlist:0.4f}s index_build={tbuild:0.4f}s '
+              f'index_lookup={tidx:0.4f}s duplicates={nlist}/{nidx}')
+# ============= EOF =============================================
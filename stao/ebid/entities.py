@@ -111,12 +111,16 @@ class EBIDWellThings(EBID_Well_Site_STAO):
 class EBIDWellDatastreams(EBID_Well_Site_STAO):
     _entity_tag = 'datastream'
 
+    def _preload(self, records):
+        self._get_resolver().prefetch([self.location_name(r) for r in records], 'name')
+
     def _transform(self, request, record):
         name = self.location_name(record)
-        loc = self._client.get_location(f"name eq '{name}'")
+        resolver = self._get_resolver()
+        loc = resolver.location(name, 'name')
 
         if 'Well' in record['location']:
-            thing = self._client.get_thing(location=loc['@iot.id'], name=WATER_WELL['name'])
+            thing = resolver.thing(loc, WATER_WELL['name'])
             if thing:
                 obsprop = next(self._client.get_observed_properties(name=DTW_OBS_PROP['name']))
                 sensor = next(self._client.get_sensors(name=ONERAIN_SENSOR['name']))
@@ -161,35 +165,17 @@ class EBIDGWLObservations(ObservationMixin, BQSTAO):
     _thing_name = WATER_WELL['name']
     _agency = AGENCY
     _timestamp_field = 'data_time'
+    _timestamp_formats = ('%Y-%m-%d %H:%M:%S',)
     _value_field = 'data_value'
+    _location_key_property = 'properties/or_site_id'
 
     # _check_existing = False
     def _transform_message(self, record):
         return 'Foo'
 
-    def _get_location(self, record, location_id=None, **kw):
-        # print(record)
-        if location_id is None:
-            location_id = record['locationId']
-            try:
-                location_id = int(location_id)
-            except ValueError:
-                pass
-
-        q = f"properties/or_site_id eq '{location_id}' and properties/agency eq '{self._agency}'"
-        return self._client.get_location(query=q), location_id
-
-    def _transform_timestamp(self, dt):
-        dt = datetime.datetime.strptime(dt, '%Y-%m-%d %H:%M:%S')
-        dt = dt.replace(tzinfo=datetime.timezone.utc)
-        return dt
-
     def _transform_value(self, v, record):
         return v*-1
 
-    def _extract_timestamp(self, dt):
-        return dt
-
 
 class DummyRequest:
     def __init__(self, p):
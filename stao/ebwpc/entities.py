@@ -29,7 +29,8 @@ from stao.constants import ENCODING_GEOJSON, WATER_WELL, NO_DESCRIPTION, DTW_OBS
     WATER_QUANTITY, GWL_DS, GWE_DS, MANUAL_GWL_DS, TRANSDUCER_SENSOR
 from stao.ebid.entities import EBIDGWLObservations
 from stao.ose_roswell_basin.entities import CKANSTAO
-from stao.util import make_geometry_point_from_latlon, copy_properties, asiotid, make_geometry_point_from_utm
+from stao.util import make_geometry_point_from_latlon, copy_properties, asiotid, make_geometry_point_from_utm, \
+    make_geometry_points_from_utm
 
 import pandas as pd
 AGENCY = 'EBWPC'
@@ -52,19 +53,41 @@ class EBWPCSTAO(CKANResourceSTAO):
 
 class EBWPCLocations(EBWPCSTAO):
     _entity_tag = 'location'
+    _geometries = None
+
+    def _preload(self, records):
+        """
+        project the coordinates of all the records in one call
+        """
+        geometries = make_geometry_points_from_utm([r['UTM_Zone13N_Easting'] for r in records],
+                                                   [r['UTM_Zone13N_Northing'] for r in records],
+                                                   ellps='GRS80', zone=13)
+        self._geometries = {r['NMBG_ID']: g for r, g in zip(records, geometries)}
+
+    def _get_geometry(self, record):
+        if self._geometries and record['NMBG_ID'] in self._geometries:
+            return self._geometries[record['NMBG_ID']]
+
+        return make_geometry_point_from_utm(float(record['UTM_Zone13N_Easting']),
+                                            float(record['UTM_Zone13N_Northing']),
+                                            ellps='GRS80',
+                                            zone=13)
 
     def _transform(self, request, record):
         if record['NMBG_ID'].endswith('archived'):
             return
 
+        geometry = self._get_geometry(record)
+        if geometry is None:
+            print(f"invalid coordinates for {record['NMBG_ID']}. "
+                  f"easting={record['UTM_Zone13N_Easting']} northing={record['UTM_Zone13N_Northing']}")
+            return
+
         properties = {'agency': AGENCY,}
 
         payload = {'name': record['NMBG_ID'],
                    'description': record['NMBG_ID'],
-                   'location': make_geometry_point_from_utm(float(record['UTM_Zone13N_Easting']),
-                                                            float(record['UTM_Zone13N_Northing']),
-                                                            ellps='GRS80',
-                                                            zone=13),
+                   'location': geometry,
                    "encodingType": ENCODING_GEOJSON,
                    'properties': properties
                    }
@@ -92,14 +115,15 @@ class EBWPCThings(EBWPCSTAO):
 class EBWPCDatastreams(EBWPCSTAO):
     _entity_tag = 'datastream'
 
-    def _transform(self, request, record):
+    def _preload(self, records):
+        self._get_resolver().prefetch([r['NMBG_ID'] for r in records], 'name', AGENCY)
 
-        loc = self._client.get_location(f"name eq '{record['NMBG_ID']}' and properties/agency eq '{AGENCY}'")
+    def _transform(self, request, record):
+        resolver = self._get_resolver()
+        loc = resolver.location(record['NMBG_ID'], 'name', AGENCY)
 
         if loc:
-            lid = loc['@iot.id']
-
-            thing = self._client.get_thing(name=WATER_WELL['name'], location=lid)
+            thing = resolver.thing(loc, WATER_WELL['name'])
             if thing:
                 obsprop = next(self._client.get_observed_properties(name=DTW_OBS_PROP['name']))
                 sensor = next(self._client.get_sensors(name=MANUAL_SENSOR['name']))
@@ -136,6 +160,9 @@ class EBWPCDatastreams(EBWPCSTAO):
 
 
 class EBWPCObservations(ObservationMixin, EBWPCSTAO):
+    _agency = AGENCY
+    _location_key_property = 'name'
+
     def __init__(self, *args, **kw):
         super(EBWPCObservations, self).__init__(*args, **kw)
         self.dataset_names = None
@@ -156,8 +183,11 @@ class EBWPCObservations(ObservationMixin, EBWPCSTAO):
 
         return excluded
 
+    def _get_location_key(self, record):
+        return record['resource']['name']
+
     def _get_location(self, record, location_id=None):
-        location_id = record['resource']['name']
+        location_id = self._get_location_key(record)
         q = f"name eq '{location_id}' and properties/agency eq '{AGENCY}'"
         return self._client.get_location(query=q), location_id
 
@@ -177,6 +207,10 @@ class EBWPCObservations(ObservationMixin, EBWPCSTAO):
 class EBWPCManualObservations(EBWPCObservations):
     _datastream_name = MANUAL_GWL_DS['name']
     _value_field = 'manual_depth_bgs'
+    _timestamp_formats = ('%m/%d/%y %I:%M',
+                          '%m/%d/%y %I:%M:%S %p',
+                          '%m/%d/%Y %I:%M:%S %p',
+                          '%m/%d/%Y %H:%M')
 
     def _get_timestamp(self, obs):
         md = obs['measurement_date']
@@ -185,21 +219,6 @@ class EBWPCManualObservations(EBWPCObservations):
             return f'{md} {mt}'
         return md
 
-    def _transform_timestamp(self, dt):
-        errors = []
-        for fmt in ('%m/%d/%y %I:%M',
-                    '%m/%d/%y %I:%M:%S %p',
-                    '%m/%d/%Y %I:%M:%S %p',
-                    '%m/%d/%Y %H:%M'):
-            try:
-                dt = datetime.datetime.strptime(dt, fmt)
-                dt = dt.replace(tzinfo=datetime.timezone.utc)
-                return dt
-            except ValueError as e:
-                errors.append(e)
-        else:
-            print('failed to parse', errors, dt)
-
 
 class EBWPCContinuousObservations(EBWPCObservations):
     _datastream_name = GWL_DS['name']
@@ -20,6 +20,7 @@ from sta.definitions import FOOT, OM_Measurement
 
 from stao.base_stao import BQSTAO, LocationGeoconnexMixin, LocationMixin, ThingMixin, DatastreamMixin, ObservationMixin
 from stao.constants import GWL_DS, WATER_WELL
+from stao.cursor import CompositeCursor, TimestampCursor, StringCursor
 
 
 # try:
@@ -106,15 +107,16 @@ class HydroVuWaterLevelsDatastreams(HydroVu_Site_STAO, DatastreamMixin):
 class HydroVuObservations(ObservationMixin, BQSTAO):
     # _tablename = 'bernco_readings'
     _fields = ['value', 'unitId', 'timestamp',
-               'locationId', 'parameterId', 'customParameter', '_airbyte_extracted_at']
+               'locationId', 'parameterId', 'customParameter', '_airbyte_extracted_at', '_airbyte_raw_id']
     _limit = 500
     _where = "parameterId=4"
 
     _entity_tag = 'observation'
 
-    _orderby = '_airbyte_extracted_at asc'
     _location_field = 'locationId'
     _cursor_id = '_airbyte_extracted_at'
+    # many rows share a sync timestamp. page on (_airbyte_extracted_at, _airbyte_raw_id) so pages do not overlap
+    _cursor_codec = CompositeCursor(TimestampCursor('_airbyte_extracted_at'), StringCursor('_airbyte_raw_id'))
     _datastream_name = GWL_DS['name']
     _thing_name = WATER_WELL['name']
 
@@ -130,7 +132,4 @@ class HydroVuObservations(ObservationMixin, BQSTAO):
 
     def _extract_timestamp(self, dt):
         return dt
-
-    def _get_cursor(self, record):
-        return record.get(self._cursor_id).isoformat()
 # ============= EOF =============================================
\ No newline at end of file
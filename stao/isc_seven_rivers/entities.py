@@ -19,16 +19,11 @@ from itertools import groupby
 from sta.definitions import FOOT, OM_Measurement
 import pytz
 
-try:
-    from stao import BQSTAO, LocationGeoconnexMixin, ObservationMixin
-    from util import make_geometry_point_from_latlon, asiotid, make_statime, observation_exists
-    from constants import DTW_OBS_PROP, WATER_WELL, GWL_DS, TOTALIZER_DS, TOTALIZER_OBSERVED_PROPERTIES, \
-        TOTALIZER_SENSOR
-except ImportError:
-    from stao.stao import BQSTAO, LocationGeoconnexMixin, ObservationMixin
-    from stao.util import make_geometry_point_from_latlon, asiotid, make_statime, observation_exists
-    from stao.constants import DTW_OBS_PROP, WATER_WELL, GWL_DS, TOTALIZER_DS, TOTALIZER_OBSERVED_PROPERTIES, \
-        TOTALIZER_SENSOR
+from stao.base_stao import BQSTAO, LocationGeoconnexMixin, ObservationMixin
+from stao.util import make_geometry_point_from_latlon, asiotid, make_statime, observation_exists
+from stao.constants import DTW_OBS_PROP, WATER_WELL, GWL_DS, TOTALIZER_DS, TOTALIZER_OBSERVED_PROPERTIES, \
+    TOTALIZER_SENSOR
+from stao.cursor import CompositeCursor, TimestampCursor, StringCursor
 
 AGENCY = 'ISC_SEVEN_RIVERS'
 
@@ -181,20 +176,21 @@ class ISCSevenRiversTotalizerDatastreams(ISCSevenRiversMonitoringPoints):
             print(f"no location for {record['name']}")
 
 
-class ISCSevenRiversWaterLevels(BQSTAO, ObservationMixin):
+class ISCSevenRiversWaterLevels(ObservationMixin, BQSTAO):
     _tablename = 'isc_water_levels'
     _fields = ['dry', 'invalid', 'comments',
                'monitoring_point_id', 'dateTime', 'depthToWaterFeet',
-               '_airbyte_extracted_at']
+               '_airbyte_extracted_at', '_airbyte_raw_id']
     _limit = 500
 
     _dataset = 'levels'
     _entity_tag = 'observation'
 
-    _orderby = '_airbyte_extracted_at asc'
     _timestamp_field = 'dateTime'
     _value_field = 'depthToWaterFeet'
     _cursor_id = '_airbyte_extracted_at'
+    # many rows share a sync timestamp. page on (_airbyte_extracted_at, _airbyte_raw_id) so pages do not overlap
+    _cursor_codec = CompositeCursor(TimestampCursor('_airbyte_extracted_at'), StringCursor('_airbyte_raw_id'))
     _location_field = 'monitoring_point_id'
     _agency = AGENCY
     _thing_name = WATER_WELL['name']
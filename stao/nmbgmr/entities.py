@@ -20,18 +20,23 @@ from itertools import groupby
 
 import jsonschema
 import requests
+from google.cloud import bigquery
 from sta.definitions import FOOT, OM_Measurement
 
 try:
     from stao import BQSTAO, LocationGeoconnexMixin, ObservationMixin
-    from util import make_geometry_point_from_utm, asiotid, make_statime, make_geometry_point_from_latlon
+    from util import make_geometry_point_from_utm, make_geometry_points_from_utm, asiotid, make_statime, \
+        make_geometry_point_from_latlon
     from constants import GWL_DS, DTW_OBS_PROP, MANUAL_SENSOR, PRESSURE_SENSOR, WATER_QUANTITY, ACOUSTIC_SENSOR, \
         WELL_LOCATION_DESCRIPTION, WATER_WELL
+    from query import make_query_parameter
 except ImportError:
     from stao.stao import BQSTAO, LocationGeoconnexMixin, ObservationMixin
-    from stao.util import make_geometry_point_from_utm, asiotid, make_statime, make_geometry_point_from_latlon
+    from stao.util import make_geometry_point_from_utm, make_geometry_points_from_utm, asiotid, make_statime, \
+        make_geometry_point_from_latlon
     from stao.constants import GWL_DS, DTW_OBS_PROP, MANUAL_SENSOR, PRESSURE_SENSOR, WATER_QUANTITY, ACOUSTIC_SENSOR, \
         WELL_LOCATION_DESCRIPTION, WATER_WELL
+    from stao.query import make_query_parameter
 
 
 class NMBGMR_Site_STAO(BQSTAO):
@@ -113,10 +118,33 @@ class NMBGMRMixin(SchemaMixin):
 
 class LocationSchemaMixin(NMBGMRMixin):
     _url = 'https://raw.githubusercontent.com/NMWDI/VocabService/main/schemas/location.schema.json#'
+    _geometries = None
+
+    def _preload(self, records):
+        """
+        project the UTM coordinates of all the records in one call per zone
+        """
+        m = UTM_REGEX.match(self._get_field_name('location'))
+        if not m:
+            return
+
+        zones = {}
+        for record in records:
+            e, n, z = (self._render(record, m.group(k), isfield=True) for k in ('easting', 'northing', 'zone'))
+            zones.setdefault(z, []).append((self._render(record, 'name'), e, n))
+
+        self._geometries = {}
+        for z, rows in zones.items():
+            names, es, ns = zip(*rows)
+            self._geometries.update(zip(names, make_geometry_points_from_utm(es, ns, z)))
 
     def _assemble_payload(self, record):
         payload = {'name': self._render(record, 'name'),
                    'description': self._render(record, 'description')}
+
+        if self._geometries and payload['name'] in self._geometries:
+            payload['location'] = self._geometries[payload['name']]
+            return payload
         # schema = self._get_schema()
         # properties = schema['properties']
         # name_field = properties['name']['fields'][self._field_tag]
@@ -180,8 +208,39 @@ class ThingSchemaMixin(NMBGMRMixin):
 class NMBGMRThings(ThingSchemaMixin, NMBGMR_Site_STAO):
     _entity_tag = 'thing'
 
+    _screen_fields = ['ScreenTop', 'ScreenBottom', 'ScreenDescription']
+    _screens = None
+
+    def _get_pointid(self, record):
+        schema = self._get_schema()
+        return record[schema['locationID']["fields"][self._field_tag]]
+
+    def _preload(self, records):
+        """
+        resolve the Locations and screens of all the records in a page with one request and one query
+        """
+        names = [self._get_pointid(r) for r in records]
+        self._get_resolver().prefetch(names, 'name')
+        self._screens = self._get_bulk_screens(names)
+
+    def _get_bulk_screens(self, pointids):
+        fs = ",".join(self._screen_fields)
+        tablename = 'nmbgmr_well_screens'
+
+        sql = f'select PointID,{fs} from {self._dataset}.{tablename} ' \
+              f'where PointID in UNNEST(@pointids)'
+        config = bigquery.QueryJobConfig(query_parameters=[bigquery.ArrayQueryParameter('pointids', 'STRING',
+                                                                                          list(pointids))])
+        screens = {p: [] for p in pointids}
+        for row in self._bq_query(sql, job_config=config):
+            screens[row['PointID']].append({fi: row[fi] for fi in self._screen_fields})
+        return screens
+
     def _get_screens(self, pointid):
-        fields = ['ScreenTop', 'ScreenBottom', 'ScreenDescription']
+        if self._screens is not None and pointid in self._screens:
+            return self._screens[pointid]
+
+        fields = self._screen_fields
         fs = ",".join(fields)
         tablename = 'nmbgmr_well_screens'
 
@@ -193,10 +252,13 @@ class NMBGMRThings(ThingSchemaMixin, NMBGMR_Site_STAO):
         return ret
 
     def _transform(self, request, record):
-        schema = self._get_schema()
-        name = record[schema['locationID']["fields"][self._field_tag]]
+        name = self._get_pointid(record)
+
+        location = self._get_resolver().location(name, 'name')
+        if not location:
+            print(f'no location {name}')
+            return
 
-        location = self._client.get_location(f"name eq '{name}'")
         screens = self._get_screens(name)
 
         properties = self._assemble_properties(record)
@@ -234,7 +296,7 @@ class NMBGMRWaterLevelDatastreams(BQSTAO):
     _dataset = 'levels'
     _entity_tag = 'datastream'
 
-    def _get_bq_items(self, fields, dataset, tablename, where=None):
+    def _get_bq_items(self, fields, dataset, tablename, where=None, params=None, **kw):
         if 'OBJECTID' not in fields:
             fields.append('OBJECTID')
 
@@ -248,10 +310,14 @@ class NMBGMRWaterLevelDatastreams(BQSTAO):
 
         sql = f'{sql} order by OBJECTID asc'
 
+        params = dict(params or {})
         if self._limit:
-            sql = f'{sql} limit {self._limit}'
+            sql = f'{sql} limit @limit'
+            params['limit'] = int(self._limit)
 
-        return self._bq_query(sql)
+        config = bigquery.QueryJobConfig(query_parameters=[make_query_parameter(k, v) for k, v in params.items()],
+                                         use_query_cache=True)
+        return self._bq_query(sql, job_config=config)
 
 
 class NMBGMRManualWaterLevelsDatastreams(NMBGMRWaterLevelDatastreams):
@@ -45,7 +45,7 @@ class OSERoswellSTAO(CKANSTAO):
 
     def _extract_hook(self, yielded, record):
         if record['site_id'] not in yielded:
-            yielded.append(record['site_id'])
+            yielded.add(record['site_id'])
             return record
 
 
@@ -91,12 +91,14 @@ class OSERoswellThings(OSERoswellSTAO):
 class OSERoswellDatastreams(OSERoswellSTAO):
     _entity_tag = 'datastream'
 
+    def _preload(self, records):
+        self._get_resolver().prefetch([r['site_id'] for r in records], 'name', AGENCY)
+
     def _transform(self, request, record):
-        loc = self._client.get_location(f"name eq '{record['site_id']}' and properties/agency eq '{AGENCY}'")
+        resolver = self._get_resolver()
+        loc = resolver.location(record['site_id'], 'name', AGENCY)
         if loc:
-            lid = loc['@iot.id']
-
-            thing = self._client.get_thing(name=WATER_WELL['name'], location=lid)
+            thing = resolver.thing(loc, WATER_WELL['name'])
             if thing:
                 obsprop = next(self._client.get_observed_properties(name=DTW_OBS_PROP['name']))
                 sensor = next(self._client.get_sensors(name=MANUAL_SENSOR['name']))
@@ -123,6 +125,11 @@ class OSERoswellDatastreams(OSERoswellSTAO):
 
 
 class OSERoswellObservations(OSERoswellSTAO, ObservationMixin):
+    _location_key_property = 'name'
+
+    def _get_location_key(self, record):
+        return record['site_id']
+
     def _extract(self, request):
         def key(r):
             print(r)
@@ -133,11 +140,12 @@ class OSERoswellObservations(OSERoswellSTAO, ObservationMixin):
             yield {'site_id': site_id, 'observations': list(gs)}
 
     def _transform(self, request, record):
-        loc = self._client.get_location(name=record['site_id'])
+        resolver = self._get_resolver()
+        loc = resolver.location(record['site_id'], 'name')
         if loc:
-            thing = self._client.get_thing(name=WATER_WELL['name'], location=loc['@iot.id'])
+            thing = resolver.thing(loc, WATER_WELL['name'])
             if thing:
-                ds = self._client.get_datastream(name=MANUAL_GWL_DS['name'], thing=thing['@iot.id'])
+                ds = resolver.datastream(thing, MANUAL_GWL_DS['name'])
 
                 vs = []
                 components = ['phenomenonTime', 'resultTime', 'result']
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
+import sys
+import time
 from itertools import groupby
 
 from sta.definitions import FOOT, OM_Measurement
@@ -227,9 +229,28 @@ class PHVObservations(HydroVuObservations):
 #     _value_field = 'value'
 
 
+def benchmark_columnar(n=50000):
+    """
+    compare rows/sec of the row by row and the columnar (BigQuery Storage Read API) extract of pvacd_readings
+    """
+    for columnar in (False, True):
+        phv = PHVObservations()
+        phv._columnar = columnar
+        phv._limit = n
+
+        st = time.time()
+        records = list(phv._extract({}))
+        et = time.time() - st
+        nrows = sum(len(r['observations']) for r in records)
+        print(f'columnar={columnar} rows={nrows} locations={len(records)} {et:0.3f}s {nrows / et:0.0f} rows/s')
+
+
 if __name__ == '__main__':
-    phv = PHVLocations()
-    # phv = PHVThings()
-    phv.render(None, dry=True)
+    if 'benchmark' in sys.argv:
+        benchmark_columnar()
+    else:
+        phv = PHVLocations()
+        # phv = PHVThings()
+        phv.render(None, dry=True)
 
 # ============= EOF =============================================
@@ -63,9 +63,13 @@ class PecosManualWaterLevelsObservations(ObservationMixin, BQSTAO):
 
     _timestamp_field = 'timestamp'
     _value_field = 'value'
+    _location_key_property = 'name'
+
+    def _get_location_key(self, record):
+        return LOCATION_IDS.get(record['locationId'])
 
     def _get_location(self, record, **kw):
-        lid = LOCATION_IDS.get(record['locationId'])
+        lid = self._get_location_key(record)
 
         q = f"name eq '{lid}' and properties/agency eq '{self._agency}'"
         return self._client.get_location(query=q), lid
@@ -0,0 +1,147 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+query.py  Parameterized BigQuery select statements
+
+Cursor values and limits are passed as query parameters so the text of a STAO's query is the same on every run and
+BigQuery can reuse cached results
+
+    q = BQQuery(['OBJECTID', 'PointID'], 'levels', 'nmbgmr_manual_gwl')
+    q.where('OBJECTID>@cursor', cursor=1234)
+    q.order_by('OBJECTID asc')
+    q.limit(100)
+    rows = client.query(q.sql(), job_config=q.job_config()).result()
+"""
+import datetime
+
+from google.cloud import bigquery
+
+
+def make_query_parameter(name, value):
+    """
+    :param name: str. parameter name without the @
+    :param value: int, float, bool, str, datetime, date or list of str/int
+    :return: ScalarQueryParameter or ArrayQueryParameter
+    """
+    if isinstance(value, (list, tuple)):
+        vtype = _get_parameter_type(value[0]) if value else 'STRING'
+        return bigquery.ArrayQueryParameter(name, vtype, list(value))
+
+    return bigquery.ScalarQueryParameter(name, _get_parameter_type(value), value)
+
+
+def _get_parameter_type(value):
+    if isinstance(value, bool):
+        return 'BOOL'
+    elif isinstance(value, int):
+        return 'INT64'
+    elif isinstance(value, float):
+        return 'FLOAT64'
+    elif isinstance(value, datetime.datetime):
+        return 'TIMESTAMP'
+    elif isinstance(value, datetime.date):
+        return 'DATE'
+    return 'STRING'
+
+
+class BQQuery:
+    """
+    select statement with named query parameters
+    """
+
+    def __init__(self, fields, dataset, tablename, alias=None, join=None):
+        self._fields = list(fields)
+        self._dataset = dataset
+        self._tablename = tablename
+        self._alias = alias
+        self._join = join
+        self._where = []
+        self._orderby = None
+        self._limit = None
+        self._outer_orderby = None
+        self.params = {}
+
+    def where(self, clause, **params):
+        """
+        add a clause. clauses are joined with "and"
+
+        :param clause: str. e.g. "OBJECTID>@cursor"
+        :param params: values of the parameters used in clause
+        """
+        if clause:
+            self._where.append(clause)
+            self.params.update(params)
+        return self
+
+    def order_by(self, orderby):
+        self._orderby = orderby
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def reorder_by(self, orderby):
+        """
+        reorder the limited rows. e.g. the rows of a page by location
+        """
+        self._outer_orderby = orderby
+        return self
+
+    def sql(self):
+        fs = ','.join(self._fields)
+        sql = f'select {fs} from {self._dataset}.{self._tablename}'
+
+        if self._alias:
+            sql = f'{sql} as {self._alias}'
+
+        if self._join:
+            sql = f'{sql} {self._join} '
+
+        if self._where:
+            where = ' and '.join(self._where)
+            sql = f'{sql} where {where}'
+
+        if self._orderby:
+            sql = f'{sql} order by {self._orderby}'
+
+        if self._limit:
+            sql = f'{sql} limit @limit'
+
+        if self._outer_orderby:
+            sql = f'select * from ({sql}) order by {self._outer_orderby}'
+        return sql
+
+    def get_params(self):
+        params = dict(self.params)
+        if self._limit:
+            params['limit'] = int(self._limit)
+        return params
+
+    def job_config(self, dry_run=False):
+        """
+        :param dry_run: bool. validate the query and estimate the bytes it scans without running it
+        :return: QueryJobConfig
+        """
+        params = [make_query_parameter(k, v) for k, v in self.get_params().items()]
+        # a cached result would make the dry run report 0 bytes
+        return bigquery.QueryJobConfig(query_parameters=params,
+                                       use_query_cache=not dry_run,
+                                       dry_run=dry_run)
+
+    def __str__(self):
+        return f'{self.sql()} params={self.get_params()}'
+# ============= EOF =============================================
@@ -0,0 +1,117 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+resolver.py  Bulk resolution of Location -> Thing -> Datastream chains
+
+"""
+EXPAND = 'Things/Datastreams'
+
+
+class EntityResolver:
+    """
+    Resolves Locations together with their Things and Datastreams using $expand.
+
+    use prefetch with all the location keys of a batch to fetch the Locations in a handful of filtered requests.
+    lookups of keys that were not prefetched cost a single request.
+
+    resolver = EntityResolver(client)
+    resolver.prefetch(['NM-0001', 'NM-0002'], 'name', agency='NMBGMR')
+    loc = resolver.location('NM-0001', 'name', agency='NMBGMR')
+    thing = resolver.thing(loc, 'Water Well')
+    ds = resolver.datastream(thing, 'Groundwater Levels')
+    """
+
+    def __init__(self, client, chunk_size=40):
+        self._client = client
+        self._chunk_size = chunk_size
+        self._locations = {}
+
+    def prefetch(self, keys, key_property='name', agency=None):
+        """
+        :param keys: iterable of location keys
+        :param key_property: str. the Location property to match the keys against. e.g "properties/source_id"
+        :param agency: str. optional. only match Locations with properties/agency eq agency
+        :return: None
+        """
+        keys = sorted({str(k) for k in keys if (key_property, agency, str(k)) not in self._locations})
+        n = self._chunk_size
+        for i in range(0, len(keys), n):
+            chunk = keys[i:i + n]
+            for k in chunk:
+                self._locations[(key_property, agency, k)] = None
+
+            q = self._make_query(chunk, key_property, agency)
+            for loc in self._client.get_locations(q, expand=EXPAND):
+                k = (key_property, agency, self._get_key(loc, key_property))
+                # keep the first match, the same Location get_location would return
+                first = self._locations.get(k)
+                if first is None:
+                    self._locations[k] = loc
+                else:
+                    print(f'duplicate location {k}. using @iot.id={first["@iot.id"]} '
+                          f'ignoring @iot.id={loc["@iot.id"]}')
+
+        print(f'prefetched {len(keys)} locations. key={key_property} agency={agency}')
+
+    def location(self, key, key_property='name', agency=None):
+        """
+        :return: location dict with expanded Things and Datastreams or None
+        """
+        k = (key_property, agency, str(key))
+        if k not in self._locations:
+            q = self._make_query([k[2]], key_property, agency)
+            self._locations[k] = next(self._client.get_locations(q, expand=EXPAND), None)
+
+        return self._locations[k]
+
+    def thing(self, location, name):
+        """
+        :return: thing dict or None
+        """
+        if 'Things' not in location:
+            try:
+                return self._client.get_thing(name=name, location=location['@iot.id'])
+            except StopIteration:
+                return
+
+        return next((t for t in location['Things'] if t['name'] == name), None)
+
+    def datastream(self, thing, name):
+        """
+        :return: datastream dict or None
+        """
+        if 'Datastreams' not in thing:
+            try:
+                return self._client.get_datastream(name=name, thing=thing['@iot.id'])
+            except StopIteration:
+                return
+
+        return next((d for d in thing['Datastreams'] if d['name'] == name), None)
+
+    def _make_query(self, keys, key_property, agency):
+        q = ' or '.join(f"{key_property} eq '{k}'" for k in keys)
+        if len(keys) > 1:
+            q = f'({q})'
+        if agency:
+            q = f"{q} and properties/agency eq '{agency}'"
+        return q
+
+    def _get_key(self, location, key_property):
+        obj = location
+        for p in key_property.split('/'):
+            obj = obj.get(p) if isinstance(obj, dict) else None
+        return str(obj)
+# ============= EOF =============================================
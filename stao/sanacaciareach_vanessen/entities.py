@@ -15,6 +15,7 @@
 # ===============================================================================
 import csv
 import urllib.request
+from bisect import bisect_right
 from datetime import datetime
 from io import BytesIO
 from itertools import groupby
@@ -88,6 +89,7 @@ class SanAcaciaReachDatastreams(DatastreamMixin, VanEssenSTAO):
     _tablename = 'vanessen_sanacacia_reach_monitoringpointlocations'
     _fields = ['id','name', 'locationID']
     _vocab_tag = 'van_essen'
+    _location_key_property = None
 
     def _transform(self, request, record):
         payload = self._make_datastream_payload(record, 'gwl', self._agency)
@@ -116,12 +118,19 @@ class SanAcaciaReachObservations(ObservationMixin, VanEssenSTAO):
     _orderby = 'MP._airbyte_raw_id asc'
 
     _datastream_name = GWL_DS['name']
+    _location_key_property = None
 
+    # monitoringPointID: (sorted fromDates, elevations)
     _ground_surface_elevation = None
     def __init__(self):
         super(SanAcaciaReachObservations, self).__init__()
         self._ground_surface_elevation = {}
 
+    def _preload(self, records):
+        super(SanAcaciaReachObservations, self)._preload(records)
+        mids = {o['monitoringPointID'] for r in records for o in r['observations']}
+        self._load_ground_surface_elevations(mids)
+
     def _extract_timestamp(self, dt):
         return int(dt)
 
@@ -148,27 +157,45 @@ class SanAcaciaReachObservations(ObservationMixin, VanEssenSTAO):
         # convert cm to feet
         return (gse-v) * 0.0328084
 
+    def _load_ground_surface_elevations(self, mids):
+        """
+        fetch the ground surface elevation history of all the monitoring points in mids with a single query
+        """
+        mids = sorted({int(m) for m in mids} - set(self._ground_surface_elevation))
+        if not mids:
+            return
+
+        ms = ','.join(str(m) for m in mids)
+        sql = f'''select monitoringPointID, fromDate, elevation from nmwdi.vanessen_sanacacia_reach_groundsurfacedata 
+        where monitoringPointID in ({ms}) 
+        order by monitoringPointID, fromDate asc'''
+
+        for mid in mids:
+            self._ground_surface_elevation[mid] = ([], [])
+
+        for r in self._bq_query(sql):
+            dates, elevations = self._ground_surface_elevation[int(r['monitoringPointID'])]
+            dates.append(self._format_from_date(r['fromDate']))
+            elevations.append(float(r['elevation']))
+
+    def _format_from_date(self, d):
+        if hasattr(d, 'strftime'):
+            return d.strftime('%Y-%m-%dT%H:%M:%S')
+        return str(d)
+
     def _get_ground_surface_elevation(self, record):
-        mid = record['monitoringPointID']
+        mid = int(record['monitoringPointID'])
         ts = record['ts']
         ts = datetime.fromtimestamp(int(ts)).strftime('%Y-%m-%dT%H:%M:%S')
 
-        if mid in self._ground_surface_elevation:
-            gse, fromDate = self._ground_surface_elevation[mid]
-            if fromDate < ts:
-                return gse
-
-        sql = f'''select fromDate, elevation from nmwdi.vanessen_sanacacia_reach_groundsurfacedata 
-        where monitoringPointID={mid} and fromDate<="{ts}" 
-        order by fromDate desc'''
-
-        results = self._bq_query(sql)
-        if results:
-            r = next(results)
-            gse = float(r['elevation'])
-            fromDate = r['fromDate']
-            self._ground_surface_elevation[mid] = (gse, fromDate)
-            return gse
+        if mid not in self._ground_surface_elevation:
+            self._load_ground_surface_elevations([mid])
+
+        # the elevation of the latest fromDate<=ts
+        dates, elevations = self._ground_surface_elevation[mid]
+        idx = bisect_right(dates, ts)
+        if idx:
+            return elevations[idx - 1]
 
 
 
@@ -0,0 +1,247 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+store.py  Small durable key/value stores used to persist STAO bookkeeping between invocations
+
+The store is selected with the STAO_STORE environment variable
+    STAO_STORE=gs://waterdatainitiative/stao.json     JSON document in a GCS bucket (default)
+    STAO_STORE=/tmp/stao.sqlite                       SQLite file. local runs only, a Cloud Function loses it on every
+                                                      cold start
+
+writes to a GCS store are buffered. call flush_stores once the entries of a load should be persisted
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE = 'gs://waterdatainitiative/stao.json'
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('create table if not exists stao_store (key text primary key, value text)')
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute('select value from stao_store where key=?', (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute('insert or replace into stao_store (key, value) values (?, ?)',
+                               (key, json.dumps(value)))
+
+    def flush(self):
+        pass
+
+
+class GCSStore:
+    """
+    keeps all entries in a single JSON blob.
+
+    writes are buffered until flush, so a render uploads the blob once. flush re-reads the blob, applies the
+    buffered entries and uploads it with a generation precondition. if another instance wrote the blob in between
+    the flush is retried. reads are refreshed after _max_age seconds
+    """
+    _max_age = 60
+    _retries = 5
+
+    def __init__(self, bucket_name, blob_name):
+        self._bucket_name = bucket_name
+        self._blob_name = blob_name
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0
+        self._pending = {}
+
+    def _get_bucket(self):
+        from google.cloud import storage
+
+        client = storage.Client()
+        return client.bucket(self._bucket_name)
+
+    def _read(self):
+        """
+        :return: (data, generation). generation is 0 if the blob does not exist
+        """
+        blob = self._get_bucket().get_blob(self._blob_name)
+        if blob is None:
+            return {}, 0
+        return json.loads(blob.download_as_bytes(if_generation_match=blob.generation)), blob.generation
+
+    def _get_data(self):
+        if self._data is None or time.time() - self._loaded_at > self._max_age:
+            self._data, _ = self._read()
+            self._loaded_at = time.time()
+        return self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._get_data().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+
+    def flush(self):
+        from google.api_core.exceptions import PreconditionFailed
+
+        with self._lock:
+            if not self._pending:
+                return
+
+            for i in range(self._retries):
+                try:
+                    data, generation = self._read()
+                    data.update(self._pending)
+                    blob = self._get_bucket().blob(self._blob_name)
+                    blob.upload_from_string(json.dumps(data), content_type='application/json',
+                                            if_generation_match=generation)
+                except PreconditionFailed:
+                    print(f'{self._blob_name} was modified by another writer. retry {i + 1}/{self._retries}')
+                    time.sleep(random.uniform(0, 0.5 * (i + 1)))
+                    continue
+
+                self._data = data
+                self._loaded_at = time.time()
+                self._pending = {}
+                return
+
+            raise RuntimeError(f'failed writing {len(self._pending)} entries to '
+                               f'gs://{self._bucket_name}/{self._blob_name}')
+
+
+STORES = {}
+STORES_LOCK = threading.Lock()
+
+
+def store_factory(uri=None):
+    """
+    return a shared store for uri. stores are reused across invocations of a warm instance
+
+    :param uri: str. "gs://<bucket>/<blob>" or a path to a SQLite file. defaults to $STAO_STORE
+    :return: SQLiteStore or GCSStore
+    """
+    if uri is None:
+        uri = os.getenv('STAO_STORE', DEFAULT_STORE)
+
+    with STORES_LOCK:
+        if uri not in STORES:
+            if uri.startswith('gs://'):
+                bucket, blob = uri[5:].split('/', 1)
+                STORES[uri] = GCSStore(bucket, blob)
+            else:
+                STORES[uri] = SQLiteStore(uri)
+        return STORES[uri]
+
+
+def flush_stores():
+    """
+    write the buffered entries of all the shared stores
+    """
+    with STORES_LOCK:
+        stores = list(STORES.values())
+
+    for store in stores:
+        store.flush()
+
+
+def make_digest(items):
+    """
+    digest of an iterable of (time, value) pairs. independent of order
+    """
+    h = hashlib.sha1()
+    for t, v in sorted((str(t), str(v)) for t, v in items):
+        h.update(f'{t},{v};'.encode('utf-8'))
+    return h.hexdigest()
+
+
+class WatermarkStore:
+    """
+    per-Datastream high-water mark.
+
+    records the latest phenomenonTime loaded into a Datastream and the digests of the most recently loaded batches
+    """
+
+    def __init__(self, store=None, ndigests=10, namespace=None):
+        """
+        :param namespace: str. the SensorThings server, e.g. the client's base_url. @iot.ids are only unique per server
+        """
+        if store is None:
+            store = store_factory()
+        self._store = store
+        self._ndigests = ndigests
+        self._namespace = namespace
+
+    def _key(self, iotid):
+        return f'watermark:{self._namespace}:{iotid}'
+
+    def get(self, iotid):
+        """
+        :param iotid: Datastream @iot.id
+        :return: dict with keys "phenomenonTime", "epoch", "digests" or None
+        """
+        return self._store.get(self._key(iotid))
+
+    def update(self, iotid, phenomenon_time, epoch, digest):
+        wm = self.get(iotid) or {'phenomenonTime': None, 'epoch': None, 'digests': []}
+        if wm['epoch'] is None or epoch > wm['epoch']:
+            wm['phenomenonTime'] = phenomenon_time
+            wm['epoch'] = epoch
+
+        digests = [d for d in wm['digests'] if d != digest]
+        digests.append(digest)
+        wm['digests'] = digests[-self._ndigests:]
+        self._store.set(self._key(iotid), wm)
+
+
+class BlobManifest:
+    """
+    generation and md5 of the GCS blobs a STAO has processed
+    """
+
+    def __init__(self, name, store=None):
+        if store is None:
+            store = store_factory()
+        self._store = store
+        self._name = name
+
+    def _key(self, blob):
+        return f'manifest:{self._name}:{blob.bucket.name}:{blob.name}'
+
+    def changed(self, blob):
+        """
+        :param blob: google.cloud.storage.Blob
+        :return: True if blob is new or has changed since it was last processed
+        """
+        entry = self._store.get(self._key(blob))
+        return not entry or entry['generation'] != blob.generation or entry['md5'] != blob.md5_hash
+
+    def update(self, blob):
+        self._store.set(self._key(blob), {'generation': blob.generation, 'md5': blob.md5_hash})
+# ============= EOF =============================================
@@ -0,0 +1,144 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+timestamps.py  Vectorized timestamp parsing and formatting
+
+Whole columns of timestamps are parsed with pandas. The format of a column is detected once from a sample of its
+values and cached by key, e.g. (STAO class name, field name)
+
+    idx = parse_timestamps(values, ('%m/%d/%Y %H:%M', '%m/%d/%y %I:%M'), key=('EBWPCManualObservations', 'ts'))
+    ts = format_timestamps(idx)
+"""
+import threading
+
+import pandas as pd
+
+ST_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+ST_FORMATS = ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ')
+EPOCH = pd.Timestamp(0, tz='UTC')
+
+# key: formats ordered by how well they matched the sample of the column
+FORMAT_CACHE = {}
+FORMAT_CACHE_LOCK = threading.Lock()
+
+
+def detect_formats(values, formats, key=None, nsample=20):
+    """
+    order formats by the number of sample values they parse. the result is cached by key
+
+    :param values: pandas Series of str
+    :param formats: list of strptime formats
+    :return: tuple of formats
+    """
+    if key is not None:
+        with FORMAT_CACHE_LOCK:
+            if key in FORMAT_CACHE:
+                return FORMAT_CACHE[key]
+
+    sample = values.dropna().head(nsample)
+    if sample.empty:
+        return tuple(formats)
+
+    scores = [pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum() for fmt in formats]
+    ordered = tuple(f for _, f in sorted(zip(scores, formats), key=lambda x: -x[0]))
+    print(f'detected timestamp format {ordered[0]} key={key}')
+
+    if key is not None:
+        with FORMAT_CACHE_LOCK:
+            FORMAT_CACHE[key] = ordered
+    return ordered
+
+
+def parse_timestamps(values, formats=None, key=None):
+    """
+    parse a column of timestamps. naive timestamps are assumed to be UTC
+
+    values are parsed with the best matching format first and the remaining formats are only tried on the values
+    that failed to parse
+
+    :param values: iterable of str or datetime
+    :param formats: list of strptime formats. if None pandas infers the format
+    :param key: hashable. cache the detected format under key
+    :return: pandas Series of datetime64[UTC]. NaT for invalid values
+    """
+    values = pd.Series(list(values), dtype=object)
+    if not formats:
+        return pd.to_datetime(values, errors='coerce', utc=True)
+
+    formats = detect_formats(values, formats, key)
+    result = pd.to_datetime(values, format=formats[0], errors='coerce', utc=True)
+    for fmt in formats[1:]:
+        missing = result.isna() & values.notna()
+        if not missing.any():
+            break
+        result[missing] = pd.to_datetime(values[missing], format=fmt, errors='coerce', utc=True)
+
+    return result
+
+
+def format_timestamps(timestamps, fmt=ST_FORMAT):
+    """
+    :param timestamps: pandas Series of datetime64
+    :return: list of str. None for NaT
+    """
+    return [None if t is None or t != t else t for t in timestamps.dt.strftime(fmt).tolist()]
+
+
+def to_datetimes(timestamps):
+    """
+    :param timestamps: pandas Series of datetime64
+    :return: list of datetime. None for NaT
+    """
+    return [None if t is pd.NaT else t.to_pydatetime() for t in timestamps.tolist()]
+
+
+def epoch_seconds(timestamps):
+    """
+    :param timestamps: pandas Series of datetime64[UTC]
+    :return: list of int. None for NaT
+    """
+    valid = timestamps.notna().tolist()
+    secs = ((timestamps - EPOCH) // pd.Timedelta(seconds=1)).tolist()
+    return [int(s) if ok else None for s, ok in zip(secs, valid)]
+
+
+if __name__ == '__main__':
+    # benchmark strptime fallbacks versus vectorized parsing
+    import datetime
+    import time
+
+    fmts = ('%m/%d/%y %I:%M', '%m/%d/%y %I:%M:%S %p', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M')
+    t0 = datetime.datetime(2020, 1, 1)
+    values = [(t0 + datetime.timedelta(minutes=15 * i)).strftime('%m/%d/%Y %H:%M') for i in range(50000)]
+
+    st = time.time()
+    out = []
+    for v in values:
+        for fmt in fmts:
+            try:
+                dt = datetime.datetime.strptime(v, fmt).replace(tzinfo=datetime.timezone.utc)
+                out.append(dt.strftime(ST_FORMAT))
+                break
+            except ValueError:
+                pass
+    tloop = time.time() - st
+
+    st = time.time()
+    vout = format_timestamps(parse_timestamps(values, fmts, key='benchmark'))
+    tvec = time.time() - st
+    assert out == vout
+    print(f'n={len(values)} strptime={tloop:0.3f}s vectorized={tvec:0.3f}s')
+# ============= EOF =============================================
@@ -24,8 +24,13 @@ import json
 import logging
 import random
 import datetime
+import itertools
+import operator
+import threading
+import time
 
 import geojson as geojson
+import numpy
 import pyproj
 import pytz
 from sta.client import Client
@@ -174,9 +179,34 @@ def make_statime(t):
 
 
 
-def make_sta_client(project_id=None, secret_id=None):
-    from google.cloud import secretmanager
+# clients are cached per (project_id, secret_id) and reused across invocations of a warm instance.
+# the secret is re-read after SECRET_TTL seconds
+SECRET_TTL = 3600
+STA_CLIENTS = {}
+STA_CLIENTS_LOCK = threading.Lock()
+SECRET_CLIENT = None
+
+
+def get_secret_client():
+    global SECRET_CLIENT
+    if SECRET_CLIENT is None:
+        from google.cloud import secretmanager
+
+        SECRET_CLIENT = secretmanager.SecretManagerServiceClient()
+    return SECRET_CLIENT
+
+
+def get_sta_connection(project_id, secret_id):
+    client = get_secret_client()
+    name = f'projects/{project_id}/secrets/{secret_id}/versions/latest'
+    response = client.access_secret_version(request={"name": name})
+
+    # WARNING: Do not print the secret in a production environment
+    payload = response.payload.data.decode("UTF-8")
+    return json.loads(payload)
 
+
+def make_sta_client(project_id=None, secret_id=None):
     if project_id is None:
         # GCP project in which to store secrets in Secret Manager.
         project_id = "95715287188"
@@ -185,51 +215,120 @@ def make_sta_client(project_id=None, secret_id=None):
         # ID of the secret to create.
         secret_id = "nmwdi_st2_connection"
 
-    # Create the Secret Manager client.
-    client = secretmanager.SecretManagerServiceClient()
-    name = f'projects/{project_id}/secrets/{secret_id}/versions/latest'
-    response = client.access_secret_version(request={"name": name})
+    key = (project_id, secret_id)
+    with STA_CLIENTS_LOCK:
+        entry = STA_CLIENTS.get(key)
+        if entry and entry['expires'] > time.time():
+            return entry['client']
 
-    # Print the secret payload.
-    #
-    # WARNING: Do not print the secret in a production environment - this
-    # snippet is showing how to access the secret material.
+        connection = get_sta_connection(project_id, secret_id)
+        if entry and entry['connection'] == connection:
+            # secret unchanged. keep the client and its HTTP session
+            stac = entry['client']
+        else:
+            stac = Client(connection['host'],
+                          connection['username'],
+                          connection['password'])
 
-    payload = response.payload.data.decode("UTF-8")
-    connection = json.loads(payload)
-    stac = Client(connection['host'],
-                  connection['username'],
-                  connection['password'])
-    return stac
+        STA_CLIENTS[key] = {'client': stac,
+                            'connection': connection,
+                            'expires': time.time() + SECRET_TTL}
+        return stac
 
 
-PROJECTIONS = {}
+BQ_PROJECT = 'waterdatainitiative-271000'
+BQ_CLIENTS = {}
+BQ_CLIENTS_LOCK = threading.Lock()
+BQ_STATS = {'clients_created': 0, 'queries': 0, 'query_seconds': 0.0}
 
 
-def make_geometry_point_from_utm(e, n, zone=None, ellps=None, srid=None):
+def get_bq_client(project=BQ_PROJECT):
+    """
+    return a shared BigQuery client for project. clients are created lazily and reused across queries and
+    invocations of a warm instance
+    """
+    with BQ_CLIENTS_LOCK:
+        client = BQ_CLIENTS.get(project)
+        if client is None:
+            from google.cloud import bigquery
+
+            client = bigquery.Client(project=project)
+            BQ_CLIENTS[project] = client
+            BQ_STATS['clients_created'] += 1
+            print(f'created BQ client project={project} stats={BQ_STATS}')
+        return client
+
+
+def record_bq_query(elapsed):
+    with BQ_CLIENTS_LOCK:
+        BQ_STATS['queries'] += 1
+        BQ_STATS['query_seconds'] += elapsed
+
+
+# pyproj Transformers from projected to geographic coordinates keyed by ("utm", zone, ellps) or ("epsg", srid)
+TRANSFORMERS = {}
+TRANSFORMERS_LOCK = threading.Lock()
+
+
+def get_inverse_transformer(zone=None, ellps=None, srid=None):
+    """
+    return a shared Transformer from UTM zone/ellps or EPSG:srid to longitude/latitude on the same datum
+    """
     if zone:
         if ellps is None:
             ellps = "WGS84"
-
-        key = f"{zone}_{ellps}"
-        if key in PROJECTIONS:
-            p = PROJECTIONS[key]
-        else:
-            p = pyproj.Proj(proj="utm", zone=int(zone), ellps=ellps)
-            PROJECTIONS[key] = p
+        key = ('utm', int(zone), ellps)
     elif srid:
-        # get zone
-        if srid in PROJECTIONS:
-            p = PROJECTIONS[srid]
-            PROJECTIONS[srid] = p
-        else:
-            # p = pyproj.Proj(proj='utm', zone=int(zone), ellps='WGS84')
-            p = pyproj.Proj(f"EPSG:{srid}")
+        key = ('epsg', int(srid))
+    else:
+        raise ValueError('zone or srid required')
+
+    with TRANSFORMERS_LOCK:
+        t = TRANSFORMERS.get(key)
+        if t is None:
+            if key[0] == 'utm':
+                crs = pyproj.CRS.from_dict({'proj': 'utm', 'zone': key[1], 'ellps': ellps})
+            else:
+                crs = pyproj.CRS(f"EPSG:{key[1]}")
+
+            t = pyproj.Transformer.from_crs(crs, crs.geodetic_crs, always_xy=True)
+            TRANSFORMERS[key] = t
+        return t
+
+
+def to_float_array(values):
+    """
+    convert values to a float array. values that cannot be converted become nan
+    """
+    try:
+        return numpy.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        def tofloat(v):
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return numpy.nan
+
+        return numpy.array([tofloat(v) for v in values], dtype=float)
 
-    lon, lat = p(e, n, inverse=True)
+
+def make_geometry_point_from_utm(e, n, zone=None, ellps=None, srid=None):
+    t = get_inverse_transformer(zone, ellps, srid)
+    lon, lat = t.transform(float(e), float(n))
     return make_geometry_point_from_latlon(lat, lon)
 
 
+def make_geometry_points_from_utm(eastings, northings, zone=None, ellps=None, srid=None):
+    """
+    project arrays of eastings and northings in a single call
+
+    :return: list of geometry points. None for the points with invalid coordinates
+    """
+    t = get_inverse_transformer(zone, ellps, srid)
+    lons, lats = t.transform(to_float_array(eastings), to_float_array(northings))
+    return make_geometry_points_from_latlon(lats, lons)
+
+
 def make_geometry_point_from_latlon(lat, lon, elevation=None):
     coordinates = [float(lon), float(lat)]
     if elevation:
@@ -238,6 +337,24 @@ def make_geometry_point_from_latlon(lat, lon, elevation=None):
     return {"type": "Point", "coordinates": coordinates}
 
 
+def make_geometry_points_from_latlon(lats, lons, elevations=None):
+    """
+    vectorized make_geometry_point_from_latlon
+
+    :return: list of geometry points. None for the points with invalid coordinates
+    """
+    lats = to_float_array(lats)
+    lons = to_float_array(lons)
+    valid = numpy.isfinite(lats) & numpy.isfinite(lons)
+    if elevations is None:
+        return [{"type": "Point", "coordinates": [lon, lat]} if ok else None
+                for lat, lon, ok in zip(lats.tolist(), lons.tolist(), valid.tolist())]
+
+    elevations = numpy.nan_to_num(to_float_array(elevations)).tolist()
+    return [{"type": "Point", "coordinates": [lon, lat, e] if e else [lon, lat]} if ok else None
+            for lat, lon, e, ok in zip(lats.tolist(), lons.tolist(), elevations, valid.tolist())]
+
+
 def make_fuzzy_geometry_from_latlon(lat, lon):
     from shapely import geometry, affinity
     center = geometry.Point(lon, lat)  # Null Island
@@ -250,6 +367,117 @@ def make_fuzzy_geometry_from_latlon(lat, lon):
     return json.loads(geojson.dumps(geometry.mapping(circle)))
 
 
+def iter_batches(records, n):
+    """
+    lazily split an iterable of records into lists of at most n records
+    """
+    it = iter(records)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def unique_records(records, key, mode='first'):
+    """
+    drop the records with duplicate keys
+
+    :param records: iterable of records
+    :param key: str. name of the key field, or callable(record) returning a hashable key
+    :param mode: str. "first" keeps the first record for each key and yields it as soon as it is seen.
+        "last" keeps the last record for each key.
+        "merge" keeps the first record for each key and adds all the records for the key to it under "rows"
+    :return: generator of records. "last" and "merge" yield in order of first occurrence once records is exhausted
+    """
+    if not callable(key):
+        key = operator.itemgetter(key)
+
+    if mode == 'first':
+        seen = set()
+        for r in records:
+            k = key(r)
+            if k not in seen:
+                seen.add(k)
+                yield r
+    elif mode == 'last':
+        keep = {}
+        for r in records:
+            keep[key(r)] = r
+        yield from keep.values()
+    elif mode == 'merge':
+        keep = {}
+        for r in records:
+            k = key(r)
+            if k in keep:
+                keep[k]['rows'].append(r)
+            else:
+                keep[k] = dict(r, rows=[r])
+        yield from keep.values()
+    else:
+        raise ValueError(f'invalid mode {mode}')
+
+
+def is_data_array(payload):
+    """
+    True if payload is a dataArray observations payload. e.g. {"Datastream":..., "observations":..., "components":...}
+    """
+    return isinstance(payload, dict) and 'observations' in payload and 'components' in payload
+
+
+def is_failed_load(obj):
+    """
+    True if obj, the result of BaseSTAO._load_record, reports a failed POST. i.e. None or a list of chunk results
+    containing None
+    """
+    return obj is None or (isinstance(obj, list) and any(o is None for o in obj))
+
+
+def frame_to_records(df):
+    """
+    convert a pandas DataFrame to a list of row dicts. timestamps are converted to datetime and missing values to None
+
+    :return: list of dict
+    """
+    columns = []
+    for c in df.columns:
+        col = df[c]
+        mask = col.isna().to_numpy()
+        if col.dtype.kind == 'M':
+            col = col.dt.to_pydatetime()
+        values = col.tolist()
+        if mask.any():
+            values = [None if m else v for v, m in zip(values, mask)]
+        columns.append(values)
+
+    names = list(df.columns)
+    return [dict(zip(names, vs)) for vs in zip(*columns)]
+
+
+def chunk_rows(rows, max_rows=None, max_bytes=None):
+    """
+    split rows into chunks of at most max_rows rows whose JSON serialization is at most max_bytes.
+
+    a row larger than max_bytes is yielded as a chunk of its own
+    :param rows: list of JSON serializable rows
+    :return: generator of (chunk, nbytes) tuples
+    """
+    chunk = []
+    nbytes = 0
+    for row in rows:
+        n = len(json.dumps(row)) + 1 if max_bytes else 0
+        if chunk and ((max_rows and len(chunk) >= max_rows) or (max_bytes and nbytes + n > max_bytes)):
+            yield chunk, nbytes
+            chunk = []
+            nbytes = 0
+
+        chunk.append(row)
+        nbytes += n
+
+    if chunk:
+        yield chunk, nbytes
+
+
 # def get_prev(context, task_id):
 #     newdate = context['prev_execution_date']
 #     logging.info(f'prevdate ={newdate}')
@@ -165,20 +165,60 @@ CITY_OF_ROSWELL = {'location': {'latitude': 'y_coord',
 
              }
 
+VOCABS = {'phv': PHV,
+          'pecos_manual': PECOS_MANUAL,
+          'bernco': BERNCO,
+          'van_essen': VAN_ESSEN,
+          'city_of_roswell': CITY_OF_ROSWELL}
+
+
+def make_accessor(spec):
+    """
+    make a callable(record, default) for a vocab entry.
+
+    an entry is either a column name, {"text": constant} or {"column": name, "postprocess": func}
+    """
+    if isinstance(spec, dict):
+        key = spec.get('column')
+        if not key:
+            text = spec.get('text')
+            return lambda record, default: text
+
+        postprocess = spec.get('postprocess')
+        if postprocess:
+            return lambda record, default: postprocess(record.get(key, default))
+    else:
+        key = spec
+        if not key:
+            return lambda record, default: None
+
+    return lambda record, default: record.get(key, default)
+
+
+def compile_vocab(vocab, prefix=None, table=None):
+    """
+    flatten a nested vocab into a table of dotted path: accessor
+    """
+    if table is None:
+        table = {}
+
+    for k, spec in vocab.items():
+        path = f'{prefix}.{k}' if prefix else k
+        table[path] = make_accessor(spec)
+        if isinstance(spec, dict) and 'column' not in spec and 'text' not in spec:
+            compile_vocab(spec, path, table)
+    return table
+
+
 class VocabMapper:
+    _table = None
+    _plans = None
+
     def load(self, name):
-        vb = {}
-        if name == 'phv':
-            vb = PHV
-        elif name == 'pecos_manual':
-            vb = PECOS_MANUAL
-        elif name == 'bernco':
-            vb = BERNCO
-        elif name == 'van_essen':
-            vb = VAN_ESSEN
-        elif name == 'city_of_roswell':
-            vb = CITY_OF_ROSWELL
+        vb = VOCABS.get(name, {})
         self._vocab = vb
+        self._table = compile_vocab(vb)
+        self._plans = {}
 
     def toST(self, path, record=None, default=None):
         """
@@ -186,14 +226,74 @@ class VocabMapper:
         :param path:
         :return:
         """
-        obj = self._vocab
+        try:
+            accessor = self._table[path]
+        except KeyError as e:
+            print('failed to find path', path)
+            raise e
+
+        return accessor(record, default)
 
+    def toST_many(self, record, paths, default=None):
+        """
+        map several paths in one pass
+
+        :param paths: list of dotted paths or a dict of key: path. a list is keyed by the last element of each path
+        e.g. ['thing.properties.ose_permit', 'thing.properties.nmbgmr_id']
+        :return: dict
+        """
+        plan = self._get_plan(paths)
+        return {k: accessor(record, default) for k, accessor in plan}
+
+    def _get_plan(self, paths):
+        """
+        list of (key, accessor) for paths. plans are compiled once per distinct list of paths
+        """
+        if isinstance(paths, dict):
+            pk = tuple(paths.items())
+        else:
+            pk = tuple(paths)
+
+        plan = self._plans.get(pk)
+        if plan is None:
+            if not isinstance(paths, dict):
+                paths = {p.split('.')[-1]: p for p in paths}
+
+            plan = []
+            for k, p in paths.items():
+                try:
+                    plan.append((k, self._table[p]))
+                except KeyError as e:
+                    print('failed to find path', p)
+                    raise e
+
+            self._plans[pk] = plan
+        return plan
+
+
+VOCAB_MAPPERS = {}
+
+
+def vocab_factory(name):
+    """
+    return a shared, compiled VocabMapper for name
+    """
+    v = VOCAB_MAPPERS.get(name)
+    if v is None:
+        v = VocabMapper()
+        v.load(name)
+        VOCAB_MAPPERS[name] = v
+    return v
+
+
+if __name__ == '__main__':
+    # microbenchmark the compiled lookups against walking the nested vocab
+    import time
+
+    def walk_toST(vocab, path, record=None, default=None):
+        obj = vocab
         for p in path.split('.'):
-            try:
-                obj = obj[p]
-            except KeyError as e:
-                print('failed to find path', path, p, obj)
-                raise e
+            obj = obj[p]
         out = None
         postprocess = None
         if isinstance(obj, dict):
@@ -202,7 +302,6 @@ class VocabMapper:
                 out = obj.get('text')
             else:
                 postprocess = obj.get('postprocess')
-
         else:
             key = obj
 
@@ -213,9 +312,35 @@ class VocabMapper:
             out = postprocess(out)
         return out
 
+    record = {'name': 'Well 1', 'well_uuid': 'abc', 'ose_permit': 'RG-1', 'point_id': 'NM-1', 'aquifer_code': 'x',
+              'well_depth': '100', 'casing_stickup': '1.5', 'screen_interval': '10-20',
+              'latitude': 35.0, 'longitude': -106.0}
+    paths = ['location.name', 'location.latitude', 'location.longitude', 'location.description',
+             'thing.properties.ose_permit', 'thing.properties.nmbgmr_id', 'thing.properties.well_uuid',
+             'thing.properties.aquifer_code', 'thing.properties.casing_stickup',
+             'thing.properties.screen_interval', 'thing.properties.well_depth']
 
-def vocab_factory(name):
-    v = VocabMapper()
-    v.load(name)
-    return v
+    m = vocab_factory('bernco')
+    n = 20000
+    for p in paths:
+        assert walk_toST(BERNCO, p, record) == m.toST(p, record), p
+
+    st = time.time()
+    for i in range(n):
+        for p in paths:
+            walk_toST(BERNCO, p, record)
+    twalk = time.time() - st
+
+    st = time.time()
+    for i in range(n):
+        for p in paths:
+            m.toST(p, record)
+    tcompiled = time.time() - st
+
+    st = time.time()
+    for i in range(n):
+        m.toST_many(record, paths)
+    tmany = time.time() - st
+
+    print(f'records={n} paths={len(paths)} walk={twalk:0.3f}s compiled={tcompiled:0.3f}s toST_many={tmany:0.3f}s')
 # ============= EOF =============================================
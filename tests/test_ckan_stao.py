@@ -0,0 +1,173 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import contextlib
+import csv
+import io
+
+import httpx
+import pytest
+
+from stao import ckan_stao
+from stao.ckan_stao import CKANSTAO, CKANResourceSTAO
+from stao.store import SQLiteStore
+
+RESOURCE = {'id': 'r1', 'url': 'https://example.com/r1.csv', 'last_modified': '2024-01-01T00:00:00'}
+CSV = b'a,b\n1,2\n'
+
+
+@pytest.fixture
+def stao(tmp_path):
+    s = CKANSTAO.__new__(CKANSTAO)
+    s.state = {}
+    s._resource_cache = SQLiteStore(str(tmp_path / 'store.sqlite'))
+    return s
+
+
+def run(stao, read):
+    """
+    read the resource once the way render does and commit the staged cache entries
+    """
+    stao._pending_resources = {}
+    result = read(stao)
+    stao._commit_resources()
+    return result
+
+
+def open_lines(stao):
+    lines = stao._open_resource(RESOURCE)
+    return list(lines) if lines is not None else None
+
+
+def fetch_text(stao):
+    return stao._fetch_resource(RESOURCE)
+
+
+def mock_stream(monkeypatch, status, content):
+    def stream(method, url, **kw):
+        return contextlib.nullcontext(httpx.Response(status, content=content))
+
+    monkeypatch.setattr(ckan_stao.httpx, 'stream', stream)
+
+
+def mock_get(monkeypatch, status, content):
+    monkeypatch.setattr(ckan_stao.httpx, 'get', lambda url, **kw: httpx.Response(status, content=content))
+
+
+def test_stream_error_not_cached(stao, monkeypatch):
+    mock_stream(monkeypatch, 500, b'<html>server error</html>')
+    assert not run(stao, open_lines)
+
+    # the next run downloads the resource again
+    mock_stream(monkeypatch, 200, CSV)
+    assert run(stao, open_lines) == ['a,b\n', '1,2\n']
+
+    # and skips it once it has been loaded
+    assert stao._check_resource(RESOURCE) is None
+
+
+def test_stream_closed(stao, monkeypatch):
+    events = []
+
+    @contextlib.contextmanager
+    def stream(method, url, **kw):
+        events.append('open')
+        try:
+            yield httpx.Response(200, content=CSV)
+        finally:
+            events.append('close')
+
+    monkeypatch.setattr(ckan_stao.httpx, 'stream', stream)
+
+    # nothing is opened until the lines are read
+    stao._open_resource(RESOURCE)
+    assert events == []
+
+    # a caller that stops early still closes the response
+    lines = stao._open_resource(RESOURCE)
+    next(lines)
+    lines.close()
+    assert events == ['open', 'close']
+
+
+def test_stream_lines_match_whole_file(stao, monkeypatch):
+    content = 'id,note\r\n1,"a\x0cb"\r\n2,"c\u2028d\ne"\n3,f\r4,g'.encode()
+
+    def stream(method, url, **kw):
+        # one byte at a time so line endings are split across chunks
+        resp = httpx.Response(200, content=content)
+        resp.iter_bytes = lambda: (content[i:i + 1] for i in range(len(content)))
+        return contextlib.nullcontext(resp)
+
+    monkeypatch.setattr(ckan_stao.httpx, 'stream', stream)
+    rows = list(csv.reader(stao._open_resource(RESOURCE)))
+    assert rows == list(csv.reader(io.StringIO(content.decode(), newline='')))
+    assert rows[1] == ['1', 'a\x0cb']
+
+
+def test_fetch_error_not_cached(stao, monkeypatch):
+    mock_get(monkeypatch, 500, b'<html>server error</html>')
+    assert run(stao, fetch_text) is None
+    assert stao._check_resource(RESOURCE) is not None
+
+    mock_get(monkeypatch, 200, CSV)
+    assert run(stao, fetch_text) == CSV.decode()
+    assert stao._check_resource(RESOURCE) is None
+
+
+class Resources(CKANResourceSTAO):
+    """
+    loads each CSV row. the POSTs of the rows with a in _failing report a failure
+    """
+    _prefetch_depth = 0
+    _failing = ()
+    datasets = ()
+
+    def _get_datasets(self):
+        return self.datasets
+
+    def _transform(self, request, record):
+        return record
+
+    def _load_record(self, payload, dry):
+        if payload['a'] not in self._failing:
+            return object()
+
+
+def test_failed_records_not_cached(tmp_path, monkeypatch):
+    r1 = dict(RESOURCE, name='r1')
+    r2 = dict(RESOURCE, id='r2', name='r2', url='https://example.com/r2.csv')
+    contents = {RESOURCE['url']: CSV, r2['url']: b'a,b\n3,4\n'}
+
+    def stream(method, url, **kw):
+        return contextlib.nullcontext(httpx.Response(200, content=contents[url]))
+
+    monkeypatch.setattr(ckan_stao.httpx, 'stream', stream)
+
+    s = Resources.__new__(Resources)
+    s.state = {}
+    s._resource_cache = SQLiteStore(str(tmp_path / 'store.sqlite'))
+    s.datasets = [r1, r2]
+    s._failing = ('3',)
+    s.render({})
+
+    # r2 is loaded again on the next run
+    assert s._check_resource(r1) is None
+    assert s._check_resource(r2) is not None
+
+    s._failing = ()
+    s.render({})
+    assert s._check_resource(r2) is None
+# ============= EOF =============================================
@@ -0,0 +1,115 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import datetime
+
+import pytest
+
+from stao.cursor import cursor_factory, CompositeCursor, IntCursor, StringCursor, StringTimestampCursor, \
+    TimestampCursor
+
+UTC = datetime.timezone.utc
+DT = datetime.datetime(2024, 6, 14, 1, 4, 51, 123456, tzinfo=UTC)
+
+
+@pytest.mark.parametrize('cursor_id, cls', [('OBJECTID', IntCursor),
+                                            ('t.id', IntCursor),
+                                            ('MP._airbyte_raw_id', StringCursor),
+                                            ('data_time', StringTimestampCursor),
+                                            ('_airbyte_extracted_at', TimestampCursor)])
+def test_factory(cursor_id, cls):
+    assert type(cursor_factory(cursor_id)) is cls
+
+
+def test_unique_cursor_is_strict():
+    assert IntCursor('OBJECTID').predicate(1234) == ('OBJECTID > @cursor', {'cursor': 1234})
+
+
+def test_timestamp_cursor_rereads_boundary():
+    where, params = cursor_factory('_airbyte_extracted_at').predicate(DT)
+    assert where == '_airbyte_extracted_at >= @cursor'
+    assert params == {'cursor': DT}
+
+
+@pytest.mark.parametrize('value', [DT,
+                                   '2024-06-14T01:04:51.123456+00:00',
+                                   '2024-06-13T19:04:51.123456-06:00'])
+def test_timestamp_round_trip(value):
+    c = TimestampCursor('t')
+    state = c.encode(value)
+    assert state == '2024-06-14T01:04:51.123456+00:00'
+    assert c.decode(state) == DT
+
+
+def test_timestamp_http_date():
+    # a state returned by a Cloud Function
+    assert TimestampCursor('t').decode('Fri, 14 Jun 2024 01:04:51 GMT') == DT.replace(microsecond=0)
+
+
+def test_naive_timestamp_is_utc():
+    assert TimestampCursor('t').decode('2024-06-14T01:04:51.123456') == DT
+
+
+@pytest.mark.parametrize('value', [None, ''])
+def test_unset(value):
+    c = TimestampCursor('t')
+    assert c.decode(value) is None
+    assert c.predicate(c.decode(value)) == (None, {})
+
+
+def test_string_timestamp():
+    c = StringTimestampCursor('data_time')
+    assert c.decode(DT) == '2024-06-14 01:04:51'
+    where, params = c.predicate('2024-06-14 01:04:51')
+    assert where == "PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', data_time) > PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', @cursor)"
+    assert params == {'cursor': '2024-06-14 01:04:51'}
+
+
+COMPOSITE = CompositeCursor(TimestampCursor('_airbyte_extracted_at'), StringCursor('_airbyte_raw_id'))
+
+
+def test_composite_predicate():
+    where, params = COMPOSITE.predicate((DT, 'abc'))
+    assert where == '((_airbyte_extracted_at > @cursor_0) or ' \
+                    '(_airbyte_extracted_at = @cursor_0 and _airbyte_raw_id > @cursor_1))'
+    assert params == {'cursor_0': DT, 'cursor_1': 'abc'}
+
+
+def test_composite_round_trip():
+    state = COMPOSITE.encode((DT, 'abc'))
+    assert state == ['2024-06-14T01:04:51.123456+00:00', 'abc']
+    assert COMPOSITE.decode(state) == (DT, 'abc')
+
+
+def test_composite_legacy_state():
+    # a single timestamp written before the cursor was composite
+    value = COMPOSITE.decode('2024-06-14T01:04:51.123456+00:00')
+    assert value == (DT, None)
+
+    where, params = COMPOSITE.predicate(value)
+    assert where == '((_airbyte_extracted_at >= @cursor_0))'
+    assert params == {'cursor_0': DT}
+
+
+def test_composite_invalid():
+    with pytest.raises(ValueError):
+        COMPOSITE.decode([1, 2, 3])
+
+
+def test_composite_row_cursor():
+    c = CompositeCursor(TimestampCursor('t._airbyte_extracted_at'), StringCursor('t._airbyte_raw_id'))
+    assert c.get_row_cursor({'_airbyte_extracted_at': DT, '_airbyte_raw_id': 'abc'}) == (DT, 'abc')
+    assert c.order_by() == 't._airbyte_extracted_at asc,t._airbyte_raw_id asc'
+# ============= EOF =============================================
@@ -0,0 +1,171 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import datetime
+
+import pytest
+
+from stao.base_stao import BaseSTAO, BQSTAO, MultifileBucketSTAO, ObservationMixin, LoadError
+from stao.hydrovu import HydroVuObservations
+from stao.isc_seven_rivers.entities import ISCSevenRiversWaterLevels
+
+
+class Observations(BaseSTAO, ObservationMixin):
+    """
+    an observation STAO that is not paged by a query. e.g. CABQ
+    """
+
+    _location_key_property = None
+
+    def _transform(self, request, record):
+        return
+
+
+class PagedObservations(ObservationMixin, BQSTAO):
+    _cursor_id = 'id'
+    _location_field = 'loc'
+    _value_field = 'v'
+
+    _location_key_property = None
+
+    def _transform(self, request, record):
+        return
+
+
+def make_stao(cls, **kw):
+    s = cls.__new__(cls)
+    s.state = {}
+    for k, v in kw.items():
+        setattr(s, k, v)
+    return s
+
+
+RECORDS = [{'locationId': 1, 'observations': [{'value': 1}, {'value': 2}]},
+           {'locationId': 2, 'observations': [{'value': 3}]}]
+
+
+@pytest.mark.parametrize('cursor_id', ['OBJECTID', None])
+def test_rows_without_cursor(cursor_id):
+    s = make_stao(Observations, _cursor_id=cursor_id)
+    state = s._load(None, RECORDS, True)
+    assert state[cursor_id] is None
+    assert state['counter'] == 1
+
+
+def test_paged_rows_cursors():
+    s = make_stao(PagedObservations)
+    records = list(s._handle_extract([{'id': 3, 'loc': 1, 'v': 1},
+                                      {'id': 1, 'loc': 2, 'v': 1},
+                                      {'id': 2, 'loc': 1, 'v': 1}]))
+    assert s._get_cursors(records[0]) == [3, 2]
+    assert s._load(None, records, True)['id'] == 3
+
+
+class FailingObservations(PagedObservations):
+    """
+    the POSTs of the locations in _failing report a failure
+    """
+    _failing = ()
+
+    def _transform(self, request, record):
+        return {'loc': record['locationId']}
+
+    def _load_record(self, payload, dry):
+        if payload['loc'] in self._failing:
+            return
+        return [object()]
+
+
+ROWS = [{'id': i, 'loc': i % 3, 'v': 1} for i in range(1, 7)]
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_failed_post_holds_cursor(concurrency):
+    s = make_stao(FailingObservations, _failing=(2,), _concurrency=concurrency)
+    state = s._load(None, s._handle_extract(ROWS), False)
+    # rows 2 and 5 failed. 1 is the latest cursor that does not skip them
+    assert state['id'] == 1
+
+
+def test_load_one_raises_on_failed_post():
+    s = make_stao(FailingObservations, _failing=(2,))
+    with pytest.raises(LoadError):
+        s._load_one(None, 0, {'locationId': 2}, False)
+
+    # a dry run does not POST so it cannot fail
+    assert s._load_one(None, 0, {'locationId': 2}, True) == 1
+
+
+@pytest.mark.parametrize('loaded, failed, previous, expected', [
+    ([1, 2, 3], [], 0, 3),
+    ([1, 3], [[2]], 0, 1),
+    ([3, 4], [[2]], 0, 0),
+    ([1, 3], [[]], 0, 0),
+    ([], [], 5, 5),
+])
+def test_safe_cursor(loaded, failed, previous, expected):
+    s = make_stao(PagedObservations)
+    s.state = {'id': previous}
+    assert s._get_safe_cursor(loaded, failed) == expected
+
+
+class Blob:
+    def __init__(self, name):
+        self.name = name
+
+
+class Manifest:
+    def __init__(self):
+        self.blobs = []
+
+    def update(self, blob):
+        self.blobs.append(blob.name)
+
+
+class Blobs(MultifileBucketSTAO):
+    """
+    each blob holds one record. the POSTs of the blobs in _failing report a failure
+    """
+    _failing = ()
+
+    def _get_blobs(self, force=False):
+        return [Blob('a.csv'), Blob('b.csv')]
+
+    def _get_extracted_data(self, blobs):
+        for blob in blobs:
+            yield blob, {'blob': blob.name}
+
+    def _load_record(self, payload, dry):
+        if payload['blob'] not in self._failing:
+            return object()
+
+
+def test_failed_blob_not_recorded():
+    s = make_stao(Blobs, _failing=('b.csv',), _manifest=Manifest())
+    s.render({})
+    assert s._manifest.blobs == ['a.csv']
+
+
+@pytest.mark.parametrize('cls', [HydroVuObservations, ISCSevenRiversWaterLevels])
+def test_airbyte_composite_cursor(cls):
+    s = make_stao(cls)
+    t = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    rows = [{s._location_field: 1, s._value_field: 1.0, '_airbyte_extracted_at': t, '_airbyte_raw_id': 'b'},
+            {s._location_field: 1, s._value_field: 1.0, '_airbyte_extracted_at': t, '_airbyte_raw_id': 'a'}]
+    record = next(s._handle_extract(rows))
+    assert s._get_cursors(record) == [(t, 'b'), (t, 'a')]
+    assert record['_airbyte_extracted_at'] == (t, 'b')
+    assert s._encode_cursor((t, 'b')) == ['2024-01-01T00:00:00.000000+00:00', 'b']
+# ============= EOF =============================================
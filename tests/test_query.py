@@ -0,0 +1,91 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import datetime
+
+import pytest
+from google.cloud import bigquery
+
+from stao.query import BQQuery, make_query_parameter
+
+
+@pytest.mark.parametrize('value, vtype', [(True, 'BOOL'),
+                                          (1, 'INT64'),
+                                          (1.5, 'FLOAT64'),
+                                          ('a', 'STRING'),
+                                          (datetime.datetime(2024, 1, 1), 'TIMESTAMP'),
+                                          (datetime.date(2024, 1, 1), 'DATE')])
+def test_scalar_parameter(value, vtype):
+    p = make_query_parameter('cursor', value)
+    assert isinstance(p, bigquery.ScalarQueryParameter)
+    assert p.name == 'cursor'
+    assert p.type_ == vtype
+    assert p.value == value
+
+
+@pytest.mark.parametrize('value, vtype', [([1, 2], 'INT64'),
+                                          (('a', 'b'), 'STRING'),
+                                          ([], 'STRING')])
+def test_array_parameter(value, vtype):
+    p = make_query_parameter('ids', value)
+    assert isinstance(p, bigquery.ArrayQueryParameter)
+    assert p.array_type == vtype
+    assert p.values == list(value)
+
+
+def make_query():
+    q = BQQuery(['OBJECTID', 'PointID'], 'levels', 'nmbgmr_manual_gwl')
+    q.where('OBJECTID > @cursor', cursor=1234)
+    q.where(None)
+    q.where('PointID is not null')
+    q.order_by('OBJECTID asc')
+    return q
+
+
+def test_sql():
+    q = make_query().limit(100)
+    assert q.sql() == 'select OBJECTID,PointID from levels.nmbgmr_manual_gwl ' \
+                      'where OBJECTID > @cursor and PointID is not null order by OBJECTID asc limit @limit'
+    assert q.get_params() == {'cursor': 1234, 'limit': 100}
+
+
+def test_sql_is_stable():
+    # only the parameters change between pages, so BQ can reuse the cached results
+    a = make_query().limit(100)
+    b = make_query().limit(500)
+    b.params['cursor'] = 5678
+    assert a.sql() == b.sql()
+
+
+def test_reorder_by():
+    q = make_query().limit(100).reorder_by('PointID')
+    assert q.sql() == 'select * from (select OBJECTID,PointID from levels.nmbgmr_manual_gwl ' \
+                      'where OBJECTID > @cursor and PointID is not null order by OBJECTID asc limit @limit) ' \
+                      'order by PointID'
+
+
+def test_alias_and_join():
+    q = BQQuery(['a.id'], 'ds', 'table', alias='a', join='join ds.other as b on a.id=b.id')
+    assert q.sql() == 'select a.id from ds.table as a join ds.other as b on a.id=b.id '
+
+
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_job_config(dry_run):
+    config = make_query().limit(100).job_config(dry_run=dry_run)
+    assert config.dry_run is dry_run
+    # a cached result would make the dry run report 0 bytes
+    assert config.use_query_cache is not dry_run
+    assert {p.name: p.value for p in config.query_parameters} == {'cursor': 1234, 'limit': 100}
+# ============= EOF =============================================
@@ -0,0 +1,97 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from google.api_core.exceptions import PreconditionFailed
+
+from stao.store import GCSStore
+
+
+class FakeBucket:
+    """
+    a bucket holding one blob. before_upload runs just before each upload to simulate another writer
+    """
+
+    def __init__(self):
+        self.content = None
+        self.generation = 0
+        self.uploads = 0
+        self.before_upload = None
+
+    def get_blob(self, name):
+        if self.content is not None:
+            return FakeBlob(self)
+
+    def blob(self, name):
+        return FakeBlob(self)
+
+
+class FakeBlob:
+    def __init__(self, bucket):
+        self._bucket = bucket
+        self.generation = bucket.generation
+
+    def download_as_bytes(self, if_generation_match=None):
+        return self._bucket.content
+
+    def upload_from_string(self, content, content_type=None, if_generation_match=None):
+        bucket = self._bucket
+        if bucket.before_upload:
+            f, bucket.before_upload = bucket.before_upload, None
+            f()
+
+        if if_generation_match != bucket.generation:
+            raise PreconditionFailed('generation mismatch')
+
+        bucket.content = content.encode()
+        bucket.generation += 1
+        bucket.uploads += 1
+
+
+def make_store(bucket):
+    store = GCSStore('bucket', 'stao.json')
+    store._get_bucket = lambda: bucket
+    return store
+
+
+def test_writes_are_buffered():
+    bucket = FakeBucket()
+    store = make_store(bucket)
+    for i in range(10):
+        store.set(f'k{i}', i)
+
+    assert bucket.uploads == 0
+    assert store.get('k3') == 3
+
+    store.flush()
+    assert bucket.uploads == 1
+    assert make_store(bucket).get('k9') == 9
+
+
+def test_concurrent_writers_are_merged():
+    bucket = FakeBucket()
+    a = make_store(bucket)
+    b = make_store(bucket)
+
+    a.set('a', 1)
+    b.set('b', 2)
+
+    # b writes between a reading and uploading the blob
+    bucket.before_upload = b.flush
+    a.flush()
+
+    c = make_store(bucket)
+    assert c.get('a') == 1
+    assert c.get('b') == 2
+# ============= EOF =============================================
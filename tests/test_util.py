@@ -0,0 +1,68 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import pytest
+
+from stao.cabq.entities import CABQThings
+from stao.util import unique_records
+
+RECORDS = [{'id': 1, 'v': 'a'},
+           {'id': 2, 'v': 'b'},
+           {'id': 1, 'v': 'c'}]
+
+
+def test_first():
+    assert list(unique_records(RECORDS, 'id')) == [RECORDS[0], RECORDS[1]]
+
+
+def test_first_is_lazy():
+    records = iter(RECORDS)
+    assert next(unique_records(records, 'id')) == RECORDS[0]
+    # only the first record has been read
+    assert next(records) == RECORDS[1]
+
+
+def test_last():
+    # in order of first occurrence
+    assert list(unique_records(RECORDS, 'id', mode='last')) == [RECORDS[2], RECORDS[1]]
+
+
+def test_merge():
+    merged = list(unique_records(RECORDS, 'id', mode='merge'))
+    assert merged == [dict(RECORDS[0], rows=[RECORDS[0], RECORDS[2]]),
+                      dict(RECORDS[1], rows=[RECORDS[1]])]
+    # the input records are not modified
+    assert 'rows' not in RECORDS[0]
+
+
+def test_callable_key():
+    assert list(unique_records(RECORDS, lambda r: r['v'] in 'ab')) == [RECORDS[0], RECORDS[2]]
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        list(unique_records(RECORDS, 'id', mode='middle'))
+
+
+def test_cabq_screens():
+    rows = [{'start_depth': '10', 'end_depth': '20'},
+            {'start_depth': '10', 'end_depth': '20'},
+            {'start_depth': None, 'end_depth': 'x'},
+            {'start_depth': '30', 'end_depth': '40'}]
+    screens = CABQThings.__new__(CABQThings)._get_screens({'rows': rows})
+    assert screens == [{'ScreenTop': 10.0, 'ScreenBottom': 20.0},
+                       {'ScreenTop': 0, 'ScreenBottom': 0},
+                       {'ScreenTop': 30.0, 'ScreenBottom': 40.0}]
+# ============= EOF =============================================
@@ -0,0 +1,124 @@
+# ===============================================================================
+# Copyright 2026 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import datetime
+
+import pytest
+
+from stao.base_stao import BaseSTAO, ObservationMixin, LoadError
+from stao.cache import CachingClient
+from stao.store import SQLiteStore, WatermarkStore
+
+DATASTREAM = {'@iot.id': 7}
+PARSED = [(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc), '2024-01-01T00:00:00.000Z', 1.5)]
+PAYLOAD = {'Datastream': DATASTREAM,
+           'observations': [('2024-01-01T00:00:00.000Z', '2024-01-01T00:00:00.000Z', 1.5)],
+           'components': ['phenomenonTime', 'resultTime', 'result']}
+
+
+class FakeClient:
+    base_url = 'https://st.example.com/FROST-Server/v1.1'
+
+    def __init__(self, result):
+        self._result = result
+
+    def add_observations(self, payload, dry=False):
+        return self._result
+
+
+class Observations(ObservationMixin, BaseSTAO):
+    _observation_chunk_rows = 100
+
+    def _transform(self, request, record):
+        self._stage_watermark(DATASTREAM, PARSED, 'digest')
+        return PAYLOAD
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStore(str(tmp_path / 'store.sqlite'))
+
+
+def make_stao(store, result):
+    s = Observations.__new__(Observations)
+    s.state = {}
+    s._client = FakeClient(result)
+    s._watermarks = WatermarkStore(store, namespace=FakeClient.base_url)
+    return s
+
+
+def test_failed_load_keeps_watermark(store):
+    s = make_stao(store, None)
+    with pytest.raises(LoadError):
+        s._load_one(None, 0, {}, False)
+    assert s._get_watermarks().get(DATASTREAM['@iot.id']) is None
+
+
+def test_load_updates_watermark(store):
+    s = make_stao(store, object())
+    s._load_one(None, 0, {}, False)
+    wm = s._get_watermarks().get(DATASTREAM['@iot.id'])
+    assert wm['digests'] == ['digest']
+
+
+class FakePystaClient:
+    """
+    a pysta client whose POSTs are stored only if ok
+    """
+    base_url = FakeClient.base_url
+
+    def __init__(self, ok):
+        self._ok = ok
+        self.queries = []
+        self.stored = set()
+
+    def add_observations(self, payload, dry=False):
+        if self._ok and not dry:
+            for t, _, v in payload['observations']:
+                self.stored.add(f'phenomenonTime eq {t} and result eq {v}')
+        return object()
+
+    def get_datastreams(self, query=None, entity=None, limit=None):
+        self.queries.append((query, entity))
+        if query in self.stored:
+            yield {'phenomenonTime': query}
+
+
+def test_watermarks_are_per_server(store):
+    prod = WatermarkStore(store, namespace='https://st.example.com/FROST-Server/v1.1')
+    staging = WatermarkStore(store, namespace='https://st-staging.example.com/FROST-Server/v1.1')
+    prod.update(7, '2024-01-01T00:00:00.000Z', 1704067200, 'digest')
+    assert staging.get(7) is None
+    assert prod.get(7)['epoch'] == 1704067200
+
+
+@pytest.mark.parametrize('ok', [True, False])
+def test_add_observations_reports_failure(ok):
+    obj = CachingClient(FakePystaClient(ok)).add_observations(PAYLOAD)
+    assert (obj is not None) == ok
+
+
+def test_add_observations_checks_each_chunk():
+    rows = [(f'2024-01-01T00:{i // 60:02d}:{i % 60:02d}.000Z', f'2024-01-01T00:{i // 60:02d}:{i % 60:02d}.000Z', i)
+            for i in range(250)]
+    client = FakePystaClient(True)
+    assert CachingClient(client).add_observations(dict(PAYLOAD, observations=rows)) is not None
+    assert [q for q, _ in client.queries] == [f'phenomenonTime eq {rows[i][0]} and result eq {i}' for i in (99, 199, 249)]
+    assert {e for _, e in client.queries} == {'Datastreams(7)/Observations'}
+
+    client = FakePystaClient(True)
+    assert CachingClient(client).add_observations(dict(PAYLOAD, observations=rows), dry=True) is not None
+    assert client.queries == []
+# ============= EOF =============================================